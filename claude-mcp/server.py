@@ -5,17 +5,34 @@ A comprehensive MCP server for controlling N8N workflows and multimodal AI servi
 """
 
 import asyncio
+import contextvars
+import hashlib
 import json
 import logging
+import multiprocessing
 import os
+import re
+import sqlite3
+import struct
 import sys
+import threading
+import time
+import uuid
+import wave
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Sequence
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
 from urllib.parse import urljoin
 
 import httpx
-from mcp.server import Server
+import numpy as np
+import redis.asyncio as redis
+import websockets
+from mcp.server import NotificationOptions, Server
 from mcp.server.models import InitializationOptions
+from mcp.server.session import ServerSession
 from mcp.server.stdio import stdio_server
 from mcp.types import (
     CallToolRequest,
@@ -30,7 +47,7 @@ from mcp.types import (
     TextContent,
     Tool,
 )
-from pydantic import BaseModel
+from pydantic import AnyUrl, BaseModel
 
 # Configure logging
 logging.basicConfig(
@@ -48,33 +65,2048 @@ class Config:
     N8N_BASE_URL = os.getenv("N8N_BASE_URL", "http://n8n-main:5678")
     N8N_API_KEY = os.getenv("N8N_API_KEY", "")
     COMFYUI_BASE_URL = os.getenv("COMFYUI_BASE_URL", "http://comfyui-main:8188")
+    # Comma-separated list of ComfyUI endpoints; defaults to the single COMFYUI_BASE_URL
+    COMFYUI_BASE_URLS = [url.strip() for url in os.getenv("COMFYUI_BASE_URLS", COMFYUI_BASE_URL).split(",") if url.strip()]
+    COMFYUI_SAMPLE_INTERVAL = float(os.getenv("COMFYUI_SAMPLE_INTERVAL", "5"))
+    COMFYUI_MIN_FREE_VRAM_MB = int(os.getenv("COMFYUI_MIN_FREE_VRAM_MB", "2048"))
+    COMFYUI_STICKY_QUEUE_SLACK = int(os.getenv("COMFYUI_STICKY_QUEUE_SLACK", "2"))
+    COMFYUI_EVENT_PROMPTS = int(os.getenv("COMFYUI_EVENT_PROMPTS", "256"))  # Prompt states kept per instance
+    COMFYUI_EVENT_HISTORY = int(os.getenv("COMFYUI_EVENT_HISTORY", "32"))   # Recent events kept per prompt
     FFCREATOR_BASE_URL = os.getenv("FFCREATOR_BASE_URL", "http://ffcreator-service:3001")
     KOKORO_BASE_URL = os.getenv("KOKORO_BASE_URL", "http://kokoro-tts-service:8880")
+    # Comma-separated replica lists; default to the single base URLs above
+    FFCREATOR_BASE_URLS = [url.strip() for url in os.getenv("FFCREATOR_BASE_URLS", FFCREATOR_BASE_URL).split(",") if url.strip()]
+    KOKORO_BASE_URLS = [url.strip() for url in os.getenv("KOKORO_BASE_URLS", KOKORO_BASE_URL).split(",") if url.strip()]
+    # FFCreator job tracking
+    FFCREATOR_POLL_INITIAL_INTERVAL = float(os.getenv("FFCREATOR_POLL_INITIAL_INTERVAL", "1"))
+    FFCREATOR_POLL_MAX_INTERVAL = float(os.getenv("FFCREATOR_POLL_MAX_INTERVAL", "15"))
+    FFCREATOR_JOB_MAX_TRACKING_SECONDS = float(os.getenv("FFCREATOR_JOB_MAX_TRACKING_SECONDS", "7200"))
+    # Rolling probe history kept per endpoint for get_service_status
+    PROBE_HISTORY_SIZE = int(os.getenv("MCP_PROBE_HISTORY_SIZE", "100"))
+    # Long-text (chunked) synthesis
+    KOKORO_CHUNK_MAX_CHARS = int(os.getenv("KOKORO_CHUNK_MAX_CHARS", "400"))
+    KOKORO_CHUNK_CONCURRENCY = int(os.getenv("KOKORO_CHUNK_CONCURRENCY", "3"))
+    KOKORO_SAMPLE_RATE = int(os.getenv("KOKORO_SAMPLE_RATE", "24000"))
+    REPLICA_MAX_FAILURES = int(os.getenv("REPLICA_MAX_FAILURES", "3"))
+    REPLICA_EJECTION_SECONDS = float(os.getenv("REPLICA_EJECTION_SECONDS", "30"))
     REDIS_URL = os.getenv("REDIS_URL", "redis://redis-cache:6379")
     
+    # Shared volumes scanned for generated assets
+    COMFYUI_OUTPUT_DIR = os.getenv("COMFYUI_OUTPUT_DIR", "/shared-data/comfyui/output")
+    FFCREATOR_OUTPUT_DIR = os.getenv("FFCREATOR_OUTPUT_DIR", "/shared-data/videos")
+    KOKORO_OUTPUT_DIR = os.getenv("KOKORO_OUTPUT_DIR", "/shared-data/kokoro/audio")
+    
+    # Seeded generation cache
+    GENERATION_CACHE_PATH = os.getenv("GENERATION_CACHE_PATH", "/app/config/generation_cache.json")
+    GENERATION_CACHE_MAX_ENTRIES = int(os.getenv("GENERATION_CACHE_MAX_ENTRIES", "10000"))
+    GENERATION_CACHE_PENDING_TTL = float(os.getenv("GENERATION_CACHE_PENDING_TTL", "3600"))
+    
+    # Offloading CPU-heavy work from the event loop
+    OFFLOAD_SIZE_THRESHOLD = int(os.getenv("MCP_OFFLOAD_SIZE_THRESHOLD", str(256 * 1024)))
+    OFFLOAD_PROCESS_WORKERS = int(os.getenv("MCP_OFFLOAD_PROCESS_WORKERS", "2"))
+    OFFLOAD_THREAD_WORKERS = int(os.getenv("MCP_OFFLOAD_THREAD_WORKERS", "4"))
+    LOOP_LAG_INTERVAL = float(os.getenv("MCP_LOOP_LAG_INTERVAL", "0.5"))
+    LOOP_LAG_WINDOW = int(os.getenv("MCP_LOOP_LAG_WINDOW", "120"))
+    
+    # Idempotency keys for side-effecting tools
+    IDEMPOTENCY_BACKEND = os.getenv("MCP_IDEMPOTENCY_BACKEND", "sqlite")  # "sqlite" or "redis"
+    IDEMPOTENCY_SQLITE_PATH = os.getenv("MCP_IDEMPOTENCY_SQLITE_PATH", "/app/config/idempotency.db")
+    IDEMPOTENCY_TTL = float(os.getenv("MCP_IDEMPOTENCY_TTL", "86400"))
+    IDEMPOTENCY_RUNNING_TTL = float(os.getenv("MCP_IDEMPOTENCY_RUNNING_TTL", "900"))
+    IDEMPOTENCY_ATTACH_TIMEOUT = float(os.getenv("MCP_IDEMPOTENCY_ATTACH_TIMEOUT", "60"))
+    
+    # Shared cache tier (in-process L1, Redis L2 at REDIS_URL)
+    CACHE_REDIS_ENABLED = os.getenv("MCP_CACHE_REDIS_ENABLED", "true").lower() == "true"
+    CACHE_L1_MAX_ENTRIES = int(os.getenv("MCP_CACHE_L1_MAX_ENTRIES", "1000"))
+    CACHE_LOCK_TIMEOUT = float(os.getenv("MCP_CACHE_LOCK_TIMEOUT", "10"))
+    CACHE_TTL_WORKFLOWS = float(os.getenv("MCP_CACHE_TTL_WORKFLOWS", "30"))
+    CACHE_TTL_SERVICE_STATUS = float(os.getenv("MCP_CACHE_TTL_SERVICE_STATUS", "5"))
+    CACHE_TTL_JOBS = float(os.getenv("MCP_CACHE_TTL_JOBS", "86400"))
+    
+    # Asset index with header metadata (dimensions, durations)
+    ASSET_INDEX_PATH = os.getenv("ASSET_INDEX_PATH", "/app/config/asset_index.json")
+    ASSET_INDEX_INTERVAL = float(os.getenv("ASSET_INDEX_INTERVAL", "30"))
+    ASSET_METADATA_WORKERS = int(os.getenv("ASSET_METADATA_WORKERS", "4"))
+    
+    # Content-addressed dedup of output files (duplicates become hardlinks)
+    DEDUP_INDEX_PATH = os.getenv("DEDUP_INDEX_PATH", "/app/config/dedup_index.json")
+    DEDUP_INTERVAL = float(os.getenv("DEDUP_INTERVAL", "0"))
+    DEDUP_ON_WRITE = os.getenv("DEDUP_ON_WRITE", "false").lower() == "true"
+    DEDUP_MIN_SIZE = int(os.getenv("DEDUP_MIN_SIZE", "4096"))
+    
+    # Tool call admission: per-tool concurrency caps in front of a bounded wait queue
+    TOOL_CONCURRENCY = json.loads(os.getenv(
+        "MCP_TOOL_CONCURRENCY",
+        '{"generate_image": 4, "create_video": 2, "synthesize_speech": 4, "execute_workflow": 8, "deduplicate_assets": 1}'
+    ))
+    TOOL_DEFAULT_CONCURRENCY = int(os.getenv("MCP_TOOL_DEFAULT_CONCURRENCY", "16"))
+    TOOL_QUEUE_SIZE = int(os.getenv("MCP_TOOL_QUEUE_SIZE", "32"))
+    TOOL_QUEUE_MAX_WAIT = float(os.getenv("MCP_TOOL_QUEUE_MAX_WAIT", "10"))
+    
+    # Resource subscription monitor
+    RESOURCE_MONITOR_INTERVAL = float(os.getenv("MCP_RESOURCE_MONITOR_INTERVAL", "10"))
+    
     # MCP Server settings
     SERVER_NAME = os.getenv("MCP_SERVER_NAME", "n8n-ai-studio-controller")
     SERVER_VERSION = os.getenv("MCP_SERVER_VERSION", "1.0.0")
 
+ASSET_EXTENSIONS = {
+    "image": {".png", ".jpg", ".jpeg", ".webp", ".gif"},
+    "video": {".mp4", ".webm", ".mov", ".mkv"},
+    "audio": {".wav", ".mp3", ".ogg", ".flac"},
+}
+
+def _dumps_json(obj: Any, kwargs: Dict[str, Any]) -> str:
+    """Module-level so process pool workers can unpickle it"""
+    return json.dumps(obj, **kwargs)
+
+def _exceeds_size(obj: Any, limit: int) -> bool:
+    """Bounded walk estimating serialized size; stops as soon as the limit is passed"""
+    budget = limit
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            budget -= 8 * len(item)
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            budget -= 8 * len(item)
+            stack.extend(item)
+        elif isinstance(item, (str, bytes)):
+            budget -= len(item)
+        else:
+            budget -= 8
+        if budget < 0:
+            return True
+    return False
+
+class OffloadExecutor:
+    """Moves CPU-heavy work off the event loop once it is big enough to stall other tool calls"""
+    
+    def __init__(self, size_threshold: int, process_workers: int, thread_workers: int):
+        self.size_threshold = size_threshold
+        self.process_workers = process_workers
+        self.thread_pool = ThreadPoolExecutor(max_workers=thread_workers, thread_name_prefix="mcp-offload")
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self.counters = {"inline": 0, "thread": 0, "process": 0}
+    
+    @property
+    def process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            # forkserver: never fork a process that already runs an event loop and worker threads
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.process_workers,
+                mp_context=multiprocessing.get_context("forkserver")
+            )
+        return self._process_pool
+    
+    async def run_in_thread(self, func, *args):
+        """For work that releases the GIL: file system scans, file I/O, hashing large buffers"""
+        self.counters["thread"] += 1
+        return await asyncio.get_running_loop().run_in_executor(self.thread_pool, func, *args)
+    
+    async def run_in_process(self, func, *args):
+        """For pure-Python CPU work that would hold the GIL; func and args must be picklable"""
+        self.counters["process"] += 1
+        return await asyncio.get_running_loop().run_in_executor(self.process_pool, func, *args)
+    
+    async def dumps(self, obj: Any, **kwargs) -> str:
+        """json.dumps, run in the process pool when the payload is large.
+        
+        With indent set, json uses its pure-Python encoder, so a thread would still hold the GIL.
+        """
+        if not _exceeds_size(obj, self.size_threshold):
+            self.counters["inline"] += 1
+            return json.dumps(obj, **kwargs)
+        return await self.run_in_process(_dumps_json, obj, kwargs)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size_threshold_bytes": self.size_threshold,
+            "process_pool_started": self._process_pool is not None,
+            "calls": dict(self.counters)
+        }
+    
+    def shutdown(self):
+        self.thread_pool.shutdown(wait=False, cancel_futures=True)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+
+class EventLoopLagMonitor:
+    """Measures how late the event loop wakes a periodic sleeper, as a proxy for blocked tool calls"""
+    
+    def __init__(self, interval: float, window: int):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+    
+    def stats(self) -> Dict[str, Any]:
+        if not self.samples:
+            return {"samples": 0}
+        lags = np.array(self.samples) * 1000
+        return {
+            "samples": len(lags),
+            "window_seconds": round(len(lags) * self.interval, 1),
+            "current_ms": round(float(lags[-1]), 2),
+            "p95_ms": round(float(np.percentile(lags, 95)), 2),
+            "max_ms": round(float(lags.max()), 2)
+        }
+
+def align_pcm_chunks(pcm_chunks: List[bytes]) -> List[bytes]:
+    """Realign 16-bit PCM chunks on sample boundaries, carrying a trailing odd byte into the next chunk"""
+    aligned = []
+    carry = b""
+    for pcm in pcm_chunks:
+        pcm = carry + pcm
+        cut = len(pcm) - len(pcm) % 2
+        aligned.append(pcm[:cut])
+        carry = pcm[cut:]
+    if carry:
+        logger.warning("Dropping a trailing half sample from synthesized PCM")
+    return aligned
+
+def write_wav(path: str, pcm_chunks: List[bytes], sample_rate: int):
+    """Write 16-bit mono PCM chunks back to back into one WAV file"""
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        for pcm in pcm_chunks:
+            wav_file.writeframes(pcm)
+
+def read_wav_samples(path: str):
+    """Read a 16-bit PCM WAV file as mono int16 samples plus its sample rate"""
+    with wave.open(path, "rb") as wav_file:
+        if wav_file.getsampwidth() != 2:
+            raise ValueError(f"Only 16-bit PCM WAV is supported: {path}")
+        channels = wav_file.getnchannels()
+        sample_rate = wav_file.getframerate()
+        samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype="<i2")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, sample_rate
+
+def _snap_frames(frames, edges, max_distance: int):
+    """Move each frame index onto the nearest edge when one is within max_distance"""
+    if len(edges) == 0:
+        return frames
+    right = np.clip(np.searchsorted(edges, frames), 0, len(edges) - 1)
+    left = np.clip(right - 1, 0, len(edges) - 1)
+    nearest = np.where(np.abs(edges[left] - frames) <= np.abs(edges[right] - frames), edges[left], edges[right])
+    return np.where(np.abs(nearest - frames) <= max_distance, nearest, frames)
+
+def extract_word_timings(samples, sample_rate: int, text: str, frame_ms: float = 10.0, snap_ms: float = 150.0, min_word_ms: float = 20.0) -> List[Dict[str, Any]]:
+    """Align the words of a script with speech energy in 16-bit mono PCM.
+    
+    Frames are classified as voiced with an adaptive dB threshold, then each word is
+    given a share of the voiced time proportional to its estimated length. Mapping those
+    shares back through the cumulative voiced-frame count places word boundaries in
+    real time, so pauses in the audio land between words instead of inside them.
+    Boundaries close to a detected speech onset/offset are snapped onto it, as long as every
+    word keeps at least min_word_ms.
+    """
+    words = text.split()
+    if not words or len(samples) == 0:
+        return []
+    
+    # Very short audio for the word count gets shorter frames, so every word still gets one
+    hop = max(1, min(int(sample_rate * frame_ms / 1000), len(samples) // len(words)))
+    frame_ms = hop * 1000 / sample_rate
+    snap_frames = int(snap_ms / frame_ms)
+    frame_count = -(-len(samples) // hop)
+    frames = np.zeros(frame_count * hop, dtype=np.float32)
+    frames[:len(samples)] = samples
+    frames = frames.reshape(frame_count, hop) / 32768.0
+    energy_db = 10.0 * np.log10(np.einsum("ij,ij->i", frames, frames) / hop + 1e-12)
+    
+    # Noise floor from the quietest frames, capped 40 dB below the loudest
+    threshold = max(np.percentile(energy_db, 10) + 10.0, energy_db.max() - 40.0)
+    voiced = energy_db > threshold
+    if not voiced.any():
+        voiced[:] = True
+    voiced_cumulative = np.cumsum(voiced)
+    
+    # Spoken length grows with letters on top of a fixed per-word cost
+    weights = np.array([2 + sum(ch.isalnum() for ch in word) for word in words], dtype=np.float64)
+    boundaries = voiced_cumulative[-1] * np.concatenate(([0.0], np.cumsum(weights) / weights.sum()))
+    start_frames = np.searchsorted(voiced_cumulative, boundaries[:-1], side="right")
+    end_frames = np.searchsorted(voiced_cumulative, boundaries[1:], side="left") + 1
+    
+    edges = np.diff(np.concatenate(([False], voiced, [False])).astype(np.int8))
+    start_frames = _snap_frames(start_frames, np.flatnonzero(edges == 1), snap_frames)
+    end_frames = _snap_frames(end_frames, np.flatnonzero(edges == -1), snap_frames)
+    # Snapping can pull starts together on fast speech; keep them min_frames apart, leaving room
+    # for the words still to come before the end of the audio
+    whole_frames = len(samples) // hop
+    min_frames = max(1, min(int(np.ceil(min_word_ms / frame_ms)), whole_frames // len(words)))
+    spacing = np.arange(len(words)) * min_frames
+    start_frames = np.minimum(start_frames, np.maximum(whole_frames - len(words) * min_frames + spacing, 0))
+    start_frames = np.maximum.accumulate(start_frames - spacing) + spacing
+    end_frames = np.maximum(end_frames, start_frames + min_frames)
+    # Snapping may move an end past the next word's start; words must not overlap
+    end_frames[:-1] = np.minimum(end_frames[:-1], start_frames[1:])
+    
+    frame_seconds = hop / sample_rate
+    starts = np.round(start_frames * frame_seconds, 3)
+    ends = np.round(np.minimum(end_frames * frame_seconds, len(samples) / sample_rate), 3)
+    return [
+        {
+            "word": word,
+            "startTime": float(start),
+            "endTime": float(end),
+            "duration": round(float(end - start), 3),
+            "index": index
+        }
+        for index, (word, start, end) in enumerate(zip(words, starts, ends))
+    ]
+
+def write_word_timings(audio_path: str, text: str, timings: List[Dict[str, Any]], duration: float) -> str:
+    """Write karaoke timing JSON next to the audio file, in the shape FFCreator templates expect"""
+    timings_path = f"{os.path.splitext(audio_path)[0]}.timings.json"
+    with open(timings_path, "w") as f:
+        json.dump({
+            "audioPath": audio_path,
+            "audioDuration": duration,
+            "textContent": text,
+            "wordTimings": timings
+        }, f, indent=2)
+    return timings_path
+
+PNG_COLOR_TYPES = {0: "grayscale", 2: "rgb", 3: "palette", 4: "grayscale_alpha", 6: "rgba"}
+
+def _read_png_metadata(f) -> Dict[str, Any]:
+    """Dimensions from the IHDR chunk, which the PNG spec requires to come first"""
+    header = f.read(26)
+    if len(header) < 26 or header[:8] != b"\x89PNG\r\n\x1a\n" or header[12:16] != b"IHDR":
+        return {}
+    width, height, bit_depth, color_type = struct.unpack(">IIBB", header[16:26])
+    return {
+        "width": width,
+        "height": height,
+        "bit_depth": bit_depth,
+        "color_type": PNG_COLOR_TYPES.get(color_type, color_type)
+    }
+
+def _read_wav_metadata(f) -> Dict[str, Any]:
+    """Format from the fmt chunk and duration from the data chunk size; samples are never read"""
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return {}
+    metadata: Dict[str, Any] = {}
+    byte_rate = 0
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            break
+        chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+        if chunk_id == b"fmt ":
+            fmt = f.read(16)
+            audio_format, channels, sample_rate, byte_rate, _, bits = struct.unpack("<HHIIHH", fmt)
+            metadata.update({"channels": channels, "sample_rate": sample_rate, "bits_per_sample": bits})
+            chunk_size -= 16
+        elif chunk_id == b"data":
+            if byte_rate:
+                metadata["duration"] = round(chunk_size / byte_rate, 3)
+            break
+        # Chunks are word aligned
+        f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    return metadata
+
+def _iter_boxes(data: bytes, start: int = 0, end: Optional[int] = None):
+    """Yield (type, body_start, body_end) for ISO BMFF boxes within a buffer"""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack(">I4s", data[offset:offset + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[offset + 8:offset + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield box_type, offset + header, min(offset + size, end)
+        offset += size
+
+def _read_mp4_metadata(f, max_moov_bytes: int = 64 * 1024 * 1024) -> Dict[str, Any]:
+    """Duration, dimensions and frame rate from the moov box; mdat is skipped without reading"""
+    moov = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        size, box_type = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header_size = 16
+        if box_type == b"moov":
+            body_size = size - header_size if size else max_moov_bytes
+            if body_size > max_moov_bytes:
+                return {}
+            moov = f.read(body_size)
+            break
+        if size == 0 or size < header_size:
+            break
+        f.seek(size - header_size, os.SEEK_CUR)
+    if moov is None:
+        return {}
+    
+    metadata: Dict[str, Any] = {}
+    for box_type, body, body_end in _iter_boxes(moov):
+        if box_type == b"mvhd":
+            if moov[body] == 1:
+                timescale, duration = struct.unpack(">IQ", moov[body + 20:body + 32])
+            else:
+                timescale, duration = struct.unpack(">II", moov[body + 12:body + 20])
+            if timescale:
+                metadata["duration"] = round(duration / timescale, 3)
+        elif box_type == b"trak":
+            track = _read_mp4_track(moov, body, body_end)
+            if track.get("handler") == "vide" and "width" not in metadata:
+                metadata.update({k: v for k, v in track.items() if k != "handler"})
+            elif track.get("handler") == "soun":
+                metadata["has_audio"] = True
+    return metadata
+
+def _read_mp4_track(data: bytes, start: int, end: int) -> Dict[str, Any]:
+    track: Dict[str, Any] = {}
+    timescale = media_duration = sample_count = 0
+    
+    def walk(start: int, end: int):
+        nonlocal timescale, media_duration, sample_count
+        for box_type, body, body_end in _iter_boxes(data, start, end):
+            if box_type in (b"mdia", b"minf", b"stbl"):
+                walk(body, body_end)
+            elif box_type == b"tkhd":
+                # Width and height are 16.16 fixed point at the end of the box
+                width, height = struct.unpack(">II", data[body_end - 8:body_end])
+                track["width"], track["height"] = width >> 16, height >> 16
+            elif box_type == b"hdlr":
+                track["handler"] = data[body + 8:body + 12].decode("latin-1")
+            elif box_type == b"mdhd":
+                if data[body] == 1:
+                    timescale, media_duration = struct.unpack(">IQ", data[body + 20:body + 32])
+                else:
+                    timescale, media_duration = struct.unpack(">II", data[body + 12:body + 20])
+            elif box_type == b"stts":
+                entries = struct.unpack(">I", data[body + 4:body + 8])[0]
+                counts = struct.unpack(f">{entries * 2}I", data[body + 8:body + 8 + entries * 8])
+                sample_count = sum(counts[::2])
+    
+    walk(start, end)
+    if track.get("handler") == "vide" and sample_count and timescale and media_duration:
+        track["frame_count"] = sample_count
+        track["fps"] = round(sample_count * timescale / media_duration, 3)
+    return track
+
+MEDIA_METADATA_READERS = {
+    ".png": _read_png_metadata,
+    ".wav": _read_wav_metadata,
+    ".mp4": _read_mp4_metadata,
+    ".mov": _read_mp4_metadata,
+}
+
+def read_media_metadata(path: str) -> Dict[str, Any]:
+    """Header-only metadata for a generated asset; empty for formats without a reader"""
+    reader = MEDIA_METADATA_READERS.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        return {}
+    try:
+        with open(path, "rb") as f:
+            return reader(f)
+    except (OSError, struct.error, IndexError, ValueError) as e:
+        logger.debug(f"Could not read media metadata from {path}: {str(e)}")
+        return {}
+
+class AssetIndex:
+    """Index of generated assets with header metadata, refreshed by a background worker pool
+    
+    Each file is parsed once; rescans only stat the output volumes and re-read files whose size
+    or mtime changed, so listing assets costs an in-memory lookup.
+    """
+    
+    def __init__(self, index_path: str, base_dirs: Sequence[str], interval: float, workers: int):
+        self.index_path = index_path
+        self.base_dirs = list(base_dirs)
+        self.interval = interval
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asset-metadata")
+        self.ready = asyncio.Event()
+        self._sorted: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._load()
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.executor.shutdown(wait=False, cancel_futures=True)
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Asset index refresh failed: {str(e)}")
+            self.ready.set()
+            await asyncio.sleep(self.interval)
+    
+    async def assets(self) -> List[Dict[str, Any]]:
+        """Indexed assets, newest first; waits for the first scan after startup"""
+        await self.ready.wait()
+        return self._sorted
+    
+    async def refresh(self) -> int:
+        """Rescan the output volumes and extract metadata for new or changed files"""
+        loop = asyncio.get_running_loop()
+        found = await loop.run_in_executor(self.executor, self._stat_files)
+        
+        changed = [
+            (path, stat) for path, stat in found.items()
+            if path not in self.entries
+            or (self.entries[path]["size_bytes"], self.entries[path]["mtime"]) != stat[1:]
+        ]
+        removed = [path for path in self.entries if path not in found]
+        for path in removed:
+            del self.entries[path]
+        
+        metadata = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, read_media_metadata, path) for path, _ in changed
+        ))
+        for (path, (asset_type, size, mtime)), meta in zip(changed, metadata):
+            self.entries[path] = {
+                "type": asset_type,
+                "name": os.path.basename(path),
+                "path": path,
+                "created": datetime.fromtimestamp(mtime).isoformat(),
+                "size_bytes": size,
+                "mtime": mtime,
+                "metadata": meta
+            }
+        
+        if changed or removed or not self._sorted:
+            self._sorted = sorted(self.entries.values(), key=lambda entry: entry["mtime"], reverse=True)
+        if changed or removed:
+            await loop.run_in_executor(self.executor, self._save)
+        return len(changed)
+    
+    def _stat_files(self) -> Dict[str, Tuple[str, int, float]]:
+        found = {}
+        for base_dir in self.base_dirs:
+            for root, _, files in os.walk(base_dir):
+                for filename in files:
+                    extension = os.path.splitext(filename)[1].lower()
+                    asset_type = next((t for t, exts in ASSET_EXTENSIONS.items() if extension in exts), None)
+                    if asset_type is None:
+                        continue
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found[path] = (asset_type, stat.st_size, stat.st_mtime)
+        return found
+    
+    def _load(self):
+        try:
+            with open(self.index_path, "r") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable asset index {self.index_path}: {str(e)}")
+    
+    def _save(self):
+        try:
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.warning(f"Could not persist asset index: {str(e)}")
+
+class OutputDeduplicator:
+    """Content-addressed deduplication of generated files on the shared output volumes
+    
+    Byte-identical files are collapsed into hardlinks to one canonical copy per device. Hashes
+    are kept in an index keyed by path and only recomputed when a file's size, mtime or inode
+    changes, so repeated runs mostly cost a stat per file.
+    """
+    
+    HASH_CHUNK_SIZE = 1024 * 1024
+    
+    def __init__(self, index_path: str, base_dirs: Sequence[str], min_size: int, interval: float):
+        self.index_path = index_path
+        self.base_dirs = list(base_dirs)
+        self.min_size = min_size
+        self.interval = interval
+        # path -> {"size", "mtime", "inode", "sha256"}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        # "<device>:<sha256>" -> canonical path
+        self.blobs: Dict[str, str] = {}
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._load()
+    
+    def start(self, offload: "OffloadExecutor"):
+        """Run the dedup pass periodically when an interval is configured"""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run(offload))
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self, offload: "OffloadExecutor"):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                report = await offload.run_in_thread(self.run)
+                logger.info(f"Output dedup reclaimed {report['reclaimed_bytes']} bytes from {report['duplicates']} duplicates")
+            except Exception as e:
+                logger.warning(f"Output dedup pass failed: {str(e)}")
+    
+    def run(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Hash every output file and hardlink duplicates; returns what was (or would be) reclaimed"""
+        with self._lock:
+            started = time.monotonic()
+            report = {"scanned": 0, "hashed": 0, "duplicates": 0, "reclaimed_bytes": 0, "errors": 0, "dry_run": dry_run}
+            seen = set()
+            for base_dir in self.base_dirs:
+                for root, _, filenames in os.walk(base_dir):
+                    for filename in filenames:
+                        path = os.path.join(root, filename)
+                        if path == self.index_path or filename.endswith(".dedup-tmp"):
+                            continue
+                        seen.add(path)
+                        self._dedup_path(path, report, dry_run)
+            for path in set(self.files) - seen:
+                del self.files[path]
+            self.blobs = {blob: path for blob, path in self.blobs.items() if path in self.files}
+            if not dry_run:
+                self._save()
+            report["elapsed_seconds"] = round(time.monotonic() - started, 3)
+            self.last_report = report
+            return report
+    
+    def dedup_new(self, paths: Sequence[str]) -> int:
+        """Deduplicate freshly written outputs against the index; returns bytes reclaimed"""
+        with self._lock:
+            report = {"scanned": 0, "hashed": 0, "duplicates": 0, "reclaimed_bytes": 0, "errors": 0}
+            for path in paths:
+                self._dedup_path(path, report, False)
+            if report["hashed"]:
+                self._save()
+            return report["reclaimed_bytes"]
+    
+    def _dedup_path(self, path: str, report: Dict[str, Any], dry_run: bool):
+        try:
+            stat = os.lstat(path)
+        except OSError:
+            return
+        if not os.path.isfile(path) or os.path.islink(path) or stat.st_size < self.min_size:
+            return
+        report["scanned"] += 1
+        
+        entry = self.files.get(path)
+        if entry is None or (entry["size"], entry["mtime"], entry["inode"]) != (stat.st_size, stat.st_mtime, stat.st_ino):
+            try:
+                digest = self._hash_file(path)
+            except OSError:
+                report["errors"] += 1
+                return
+            report["hashed"] += 1
+            entry = {"size": stat.st_size, "mtime": stat.st_mtime, "inode": stat.st_ino, "sha256": digest}
+            self.files[path] = entry
+        
+        blob = f"{stat.st_dev}:{entry['sha256']}"
+        canonical = self.blobs.get(blob)
+        if canonical is None or canonical == path or not self._still_matches(canonical):
+            self.blobs[blob] = path
+            return
+        try:
+            canonical_stat = os.stat(canonical)
+        except OSError:
+            # The canonical copy went away since it was checked; keep this file as the new one
+            self.files.pop(canonical, None)
+            self.blobs[blob] = path
+            return
+        if canonical_stat.st_ino == stat.st_ino:
+            return
+        
+        report["duplicates"] += 1
+        report["reclaimed_bytes"] += stat.st_size
+        if dry_run:
+            return
+        tmp_path = f"{path}.dedup-tmp"
+        try:
+            os.link(canonical, tmp_path)
+            # Links share one mtime; keep the newer of the two so a fresh output isn't listed among old ones
+            if stat.st_mtime_ns > canonical_stat.st_mtime_ns:
+                os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not hardlink {path} to {canonical}: {str(e)}")
+            report["duplicates"] -= 1
+            report["reclaimed_bytes"] -= stat.st_size
+            report["errors"] += 1
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+        linked_mtime = max(stat.st_mtime, canonical_stat.st_mtime)
+        self.files[canonical]["mtime"] = linked_mtime
+        self.files[path] = {**self.files[canonical], "inode": canonical_stat.st_ino}
+    
+    def _still_matches(self, canonical: str) -> bool:
+        """A canonical copy edited or deleted since it was indexed can no longer be linked to"""
+        entry = self.files.get(canonical)
+        try:
+            stat = os.stat(canonical)
+        except OSError:
+            return False
+        return entry is not None and (entry["size"], entry["mtime"], entry["inode"]) == (stat.st_size, stat.st_mtime, stat.st_ino)
+    
+    def _hash_file(self, path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(self.HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "indexed_files": len(self.files),
+            "unique_blobs": len(self.blobs),
+            "last_run": self.last_report
+        }
+    
+    def _load(self):
+        try:
+            with open(self.index_path, "r") as f:
+                data = json.load(f)
+            self.files = data.get("files", {})
+            self.blobs = data.get("blobs", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable dedup index {self.index_path}: {str(e)}")
+    
+    def _save(self):
+        try:
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"files": self.files, "blobs": self.blobs}, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.warning(f"Could not persist dedup index: {str(e)}")
+
+class SQLiteIdempotencyStore:
+    """Idempotency records in a local SQLite file; shared between replicas only via a shared volume"""
+    
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS idempotency (key TEXT PRIMARY KEY, record TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+    
+    async def claim(self, key: str, record: Dict[str, Any], ttl: float) -> bool:
+        """Atomically create the record unless a live one exists"""
+        now = time.time()
+        self.connection.execute("DELETE FROM idempotency WHERE key = ? AND expires_at <= ?", (key, now))
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO idempotency (key, record, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(record), now + ttl)
+        )
+        return cursor.rowcount == 1
+    
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self.connection.execute(
+            "SELECT record FROM idempotency WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    async def set(self, key: str, record: Dict[str, Any], ttl: float):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO idempotency (key, record, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(record), time.time() + ttl)
+        )
+    
+    async def delete(self, key: str):
+        self.connection.execute("DELETE FROM idempotency WHERE key = ?", (key,))
+    
+    async def close(self):
+        self.connection.close()
+
+class RedisIdempotencyStore:
+    """Idempotency records in Redis, shared by every MCP server replica"""
+    
+    PREFIX = "mcp:idempotency:"
+    
+    def __init__(self, url: str):
+        self.client = redis.from_url(url, decode_responses=True)
+    
+    async def claim(self, key: str, record: Dict[str, Any], ttl: float) -> bool:
+        return bool(await self.client.set(self.PREFIX + key, json.dumps(record), nx=True, px=int(ttl * 1000)))
+    
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = await self.client.get(self.PREFIX + key)
+        return json.loads(value) if value else None
+    
+    async def set(self, key: str, record: Dict[str, Any], ttl: float):
+        await self.client.set(self.PREFIX + key, json.dumps(record), px=int(ttl * 1000))
+    
+    async def delete(self, key: str):
+        await self.client.delete(self.PREFIX + key)
+    
+    async def close(self):
+        await self.client.aclose()
+
+class TieredCache:
+    """In-process L1 in front of a Redis L2 shared by all MCP server replicas.
+    
+    Values must be JSON-serializable. Invalidations are broadcast over Redis pub/sub so every
+    replica drops its L1 copy, and concurrent misses for the same key are collapsed into one
+    load: per process with a lock, across replicas with a short-lived Redis lock. If Redis is
+    unavailable the cache keeps working as L1 only.
+    """
+    
+    PREFIX = "mcp:cache:"
+    LOCK_PREFIX = "mcp:cache-lock:"
+    CHANNEL = "mcp:cache:invalidate"
+    
+    def __init__(self, redis_url: Optional[str], l1_max_entries: int, lock_timeout: float):
+        self.redis_url = redis_url
+        self.l1: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.l1_max_entries = l1_max_entries
+        self.lock_timeout = lock_timeout
+        self.client = None
+        self.counters = {"l1_hits": 0, "l2_hits": 0, "loads": 0, "redis_errors": 0}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._listener: Optional[asyncio.Task] = None
+    
+    def start(self):
+        if self.redis_url and self.client is None:
+            self.client = redis.from_url(self.redis_url, decode_responses=True)
+            self._listener = asyncio.create_task(self._listen())
+    
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+    
+    async def _listen(self):
+        """Drop L1 entries invalidated by any replica; reconnects if Redis goes away"""
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.subscribe(self.CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self.l1.pop(message["data"], None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener error: {str(e)}")
+                # Missed invalidations could leave stale L1 entries, so start clean
+                self.l1.clear()
+            finally:
+                # Each attempt opens its own connection; give it back before reconnecting
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(5)
+    
+    def _get_l1(self, key: str) -> Tuple[bool, Any]:
+        entry = self.l1.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self.l1[key]
+            return False, None
+        self.l1.move_to_end(key)
+        return True, value
+    
+    def _set_l1(self, key: str, value: Any, ttl: float):
+        self.l1[key] = (time.monotonic() + ttl, value)
+        self.l1.move_to_end(key)
+        while len(self.l1) > self.l1_max_entries:
+            self.l1.popitem(last=False)
+    
+    async def _get_l2(self, key: str) -> Tuple[bool, Any, float]:
+        """Value plus its remaining TTL, so the L1 copy never outlives the shared one"""
+        if self.client is None:
+            return False, None, 0.0
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                value, ttl_ms = await pipe.get(self.PREFIX + key).pttl(self.PREFIX + key).execute()
+        except Exception as e:
+            self._redis_error(e)
+            return False, None, 0.0
+        if value is None:
+            return False, None, 0.0
+        return True, json.loads(value), max(ttl_ms, 0) / 1000
+    
+    async def get(self, key: str) -> Tuple[bool, Any]:
+        hit, value = self._get_l1(key)
+        if hit:
+            self.counters["l1_hits"] += 1
+            return True, value
+        hit, value, ttl = await self._get_l2(key)
+        if hit:
+            self.counters["l2_hits"] += 1
+            self._set_l1(key, value, ttl)
+        return hit, value
+    
+    async def set(self, key: str, value: Any, ttl: float):
+        self._set_l1(key, value, ttl)
+        if self.client is not None:
+            try:
+                await self.client.set(self.PREFIX + key, json.dumps(value), px=int(ttl * 1000))
+            except Exception as e:
+                self._redis_error(e)
+    
+    async def invalidate(self, key: str):
+        """Remove a key here, in Redis and in every other replica's L1"""
+        self.l1.pop(key, None)
+        if self.client is not None:
+            try:
+                await self.client.delete(self.PREFIX + key)
+                await self.client.publish(self.CHANNEL, key)
+            except Exception as e:
+                self._redis_error(e)
+    
+    async def get_or_load(self, key: str, loader, ttl: float) -> Any:
+        """Return the cached value or load it once, no matter how many callers miss together"""
+        hit, value = await self.get(key)
+        if hit:
+            return value
+        
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                # Another coroutine in this process may have loaded it while we waited
+                hit, value = await self.get(key)
+                if hit:
+                    return value
+                
+                lock_key = self.LOCK_PREFIX + key
+                holds_lock = await self._acquire_shared_lock(lock_key)
+                if not holds_lock:
+                    hit, value = await self._wait_for_shared_value(key)
+                    if hit:
+                        return value
+                try:
+                    self.counters["loads"] += 1
+                    value = await loader()
+                    await self.set(key, value, ttl)
+                    return value
+                finally:
+                    if holds_lock and self.client is not None:
+                        await self._release_shared_lock(lock_key)
+        finally:
+            if not lock.locked() and self._locks.get(key) is lock:
+                del self._locks[key]
+    
+    async def _acquire_shared_lock(self, lock_key: str) -> bool:
+        if self.client is None:
+            return True
+        try:
+            return bool(await self.client.set(lock_key, "1", nx=True, px=int(self.lock_timeout * 1000)))
+        except Exception as e:
+            self._redis_error(e)
+            return True
+    
+    async def _release_shared_lock(self, lock_key: str):
+        try:
+            await self.client.delete(lock_key)
+        except Exception as e:
+            self._redis_error(e)
+    
+    async def _wait_for_shared_value(self, key: str) -> Tuple[bool, Any]:
+        """Another replica is loading this key; wait for its result until its lock would expire"""
+        deadline = time.monotonic() + self.lock_timeout
+        interval = 0.05
+        while time.monotonic() < deadline:
+            await asyncio.sleep(interval)
+            hit, value, ttl = await self._get_l2(key)
+            if hit:
+                self.counters["l2_hits"] += 1
+                self._set_l1(key, value, ttl)
+                return True, value
+            interval = min(interval * 2, 1.0)
+        return False, None
+    
+    def _redis_error(self, error: Exception):
+        self.counters["redis_errors"] += 1
+        logger.warning(f"Redis cache tier unavailable, using L1 only: {str(error)}")
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "l2": "redis" if self.client is not None else "disabled",
+            "l1_entries": len(self.l1),
+            **self.counters
+        }
+
+class ResourceMonitor:
+    """Background monitor that pushes resource updates to subscribed MCP sessions"""
+    
+    STATUS_URI = "services://status"
+    ASSETS_URI = "assets://generated"
+    
+    def __init__(self, mcp_server: "N8NMCPServer", interval: float):
+        self.mcp_server = mcp_server
+        self.interval = interval
+        self.subscriptions: Dict[str, Set[ServerSession]] = {}
+        self.snapshots: Dict[str, Any] = {}
+        self.snapshot_times: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    def subscribe(self, uri: str, session: ServerSession):
+        """Register a session for update notifications on a resource"""
+        self.subscriptions.setdefault(uri, set()).add(session)
+        logger.info(f"Session subscribed to {uri} ({len(self.subscriptions[uri])} subscribers)")
+    
+    def unsubscribe(self, uri: str, session: ServerSession):
+        """Remove a session from a resource's subscribers"""
+        sessions = self.subscriptions.get(uri)
+        if sessions:
+            sessions.discard(session)
+            if not sessions:
+                del self.subscriptions[uri]
+    
+    def get_snapshot(self, uri: str) -> Optional[Any]:
+        """Return the latest polled value for a resource if it is still fresh"""
+        taken_at = self.snapshot_times.get(uri)
+        if taken_at is None or time.monotonic() - taken_at > 2 * self.interval:
+            return None
+        return self.snapshots[uri]
+    
+    def start(self):
+        """Start the background polling task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop the background polling task"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Resource monitor poll failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+    
+    async def poll(self):
+        """Refresh subscribed resources and notify on meaningful changes"""
+        if self.subscriptions.get(self.STATUS_URI):
+            status = await self.mcp_server._get_all_service_status()
+            previous = self.snapshots.get(self.STATUS_URI)
+            self._store(self.STATUS_URI, status)
+            if previous is not None and self._health_flipped(previous, status):
+                await self._notify(self.STATUS_URI)
+        
+        if self.subscriptions.get(self.ASSETS_URI):
+            assets = await self.mcp_server._get_generated_assets()
+            previous = self.snapshots.get(self.ASSETS_URI)
+            self._store(self.ASSETS_URI, assets)
+            if previous is not None and self._new_assets(previous, assets):
+                await self._notify(self.ASSETS_URI)
+    
+    def _store(self, uri: str, value: Any):
+        self.snapshots[uri] = value
+        self.snapshot_times[uri] = time.monotonic()
+    
+    @staticmethod
+    def _health_flipped(previous: Dict[str, Any], current: Dict[str, Any]) -> bool:
+        """Only status transitions count, not changes in probe details"""
+        previous_health = {name: entry.get("status") for name, entry in previous.items()}
+        current_health = {name: entry.get("status") for name, entry in current.items()}
+        return previous_health != current_health
+    
+    @staticmethod
+    def _new_assets(previous: List[Dict[str, Any]], current: List[Dict[str, Any]]) -> bool:
+        """Deletions are ignored; only newly landed files trigger an update"""
+        known_paths = {asset["path"] for asset in previous}
+        return any(asset["path"] not in known_paths for asset in current)
+    
+    async def _notify(self, uri: str):
+        logger.info(f"Resource {uri} changed, notifying {len(self.subscriptions.get(uri, ()))} subscribers")
+        for session in list(self.subscriptions.get(uri, ())):
+            try:
+                await session.send_resource_updated(AnyUrl(uri))
+            except Exception as e:
+                logger.warning(f"Dropping subscriber for {uri}: {str(e)}")
+                self.unsubscribe(uri, session)
+
+class ProbeHistory:
+    """Fixed-size ring buffer of health probe latencies and outcomes"""
+    
+    def __init__(self, size: int):
+        self.samples: deque = deque(maxlen=size)
+        self.last_failure: Optional[float] = None
+    
+    def record(self, latency_ms: float, ok: bool):
+        self.samples.append((latency_ms, ok))
+        if not ok:
+            self.last_failure = time.time()
+    
+    def stats(self) -> Dict[str, Any]:
+        return ProbeHistory.summarize([self])
+    
+    @staticmethod
+    def summarize(histories: List["ProbeHistory"]) -> Dict[str, Any]:
+        """Rolling latency percentiles and error rate across one or more endpoints"""
+        samples = [sample for history in histories for sample in history.samples]
+        failures = [history.last_failure for history in histories if history.last_failure is not None]
+        if not samples:
+            return {"samples": 0}
+        latencies = np.array([latency for latency, _ in samples])
+        ok = np.array([outcome for _, outcome in samples])
+        return {
+            "samples": len(samples),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+            "error_rate": round(float(1.0 - ok.mean()), 3),
+            "seconds_since_last_failure": round(time.time() - max(failures), 1) if failures else None
+        }
+
+class Replica:
+    """Request accounting for one replica of a horizontally scaled service"""
+    
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.total_requests = 0
+        self.total_failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.probes = ProbeHistory(Config.PROBE_HISTORY_SIZE)
+    
+    @property
+    def ejected(self) -> bool:
+        return time.monotonic() < self.ejected_until
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+            "ejected": self.ejected,
+            "ejected_for_seconds": round(max(0.0, self.ejected_until - time.monotonic()), 1),
+            "latency": self.probes.stats()
+        }
+
+class ReplicaSet:
+    """Least-outstanding-requests balancer with passive ejection of failing replicas"""
+    
+    def __init__(self, name: str, urls: List[str], max_failures: int, ejection_seconds: float):
+        self.name = name
+        self.replicas = [Replica(url) for url in urls]
+        self.max_failures = max_failures
+        self.ejection_seconds = ejection_seconds
+    
+    def pick(self) -> Replica:
+        """Replica with the fewest in-flight requests, skipping ejected ones while any remain"""
+        candidates = [r for r in self.replicas if not r.ejected]
+        if not candidates:
+            # Everything is ejected: try the replica that is due back first rather than failing outright
+            return min(self.replicas, key=lambda r: r.ejected_until)
+        return min(candidates, key=lambda r: (r.outstanding, r.total_requests))
+    
+    @asynccontextmanager
+    async def request(self):
+        """Reserve a replica for the duration of one request and record the outcome"""
+        replica = self.pick()
+        replica.outstanding += 1
+        replica.total_requests += 1
+        try:
+            yield replica
+        except Exception as e:
+            if self._is_replica_failure(e):
+                self._record_failure(replica)
+            raise
+        else:
+            replica.consecutive_failures = 0
+        finally:
+            replica.outstanding -= 1
+    
+    @staticmethod
+    def _is_replica_failure(error: Exception) -> bool:
+        """Transport errors and 5xx count against the replica; 4xx are the caller's fault"""
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        return isinstance(error, httpx.TransportError)
+    
+    def _record_failure(self, replica: Replica):
+        replica.total_failures += 1
+        replica.consecutive_failures += 1
+        if replica.consecutive_failures >= self.max_failures:
+            replica.ejected_until = time.monotonic() + self.ejection_seconds
+            replica.consecutive_failures = 0
+            logger.warning(f"Ejecting {self.name} replica {replica.url} for {self.ejection_seconds}s")
+    
+    def status(self) -> List[Dict[str, Any]]:
+        return [replica.to_dict() for replica in self.replicas]
+
+class FFCreatorJobTracker:
+    """Polls FFCreator job status with adaptive backoff; concurrent waiters share one poller per job"""
+    
+    TERMINAL_STATES = {"completed", "failed"}
+    
+    def __init__(self, initial_interval: float, max_interval: float, max_tracking_seconds: float, max_jobs: int = 1000):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.max_tracking_seconds = max_tracking_seconds
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pollers: Dict[str, asyncio.Task] = {}
+    
+    def register(self, job_id: str, base_url: str, duration: Optional[float] = None):
+        """Remember which replica owns a job so later polls go to the right place"""
+        self.jobs[job_id] = {
+            "job_id": job_id,
+            "ffcreator_instance": base_url,
+            "status": "queued",
+            "progress": 0,
+            "duration": duration,
+            "tracking_started": time.time()
+        }
+        while len(self.jobs) > self.max_jobs:
+            old_id, _ = self.jobs.popitem(last=False)
+            poller = self._pollers.pop(old_id, None)
+            if poller is not None:
+                poller.cancel()
+    
+    def track(self, job_id: str, http_client: httpx.AsyncClient) -> asyncio.Task:
+        """Return the shared poller for a job, starting it if nobody is tracking it yet"""
+        poller = self._pollers.get(job_id)
+        if poller is None:
+            poller = asyncio.create_task(self._poll(job_id, http_client))
+            self._pollers[job_id] = poller
+            # An evicted poller finishing late must not drop a newer poller for the same job
+            poller.add_done_callback(lambda done: self._pollers.pop(job_id) if self._pollers.get(job_id) is done else None)
+        return poller
+    
+    async def stop(self):
+        """Cancel all pollers"""
+        for poller in list(self._pollers.values()):
+            poller.cancel()
+        await asyncio.gather(*self._pollers.values(), return_exceptions=True)
+    
+    async def wait(self, job_id: str, http_client: httpx.AsyncClient, timeout: float) -> Dict[str, Any]:
+        """Wait for a job to finish; on timeout return the latest known state and keep polling"""
+        job = self.jobs[job_id]
+        if job["status"] in self.TERMINAL_STATES:
+            return job
+        poller = self.track(job_id, http_client)
+        try:
+            # Shielded so one waiter giving up doesn't cancel the poller other waiters share
+            return await asyncio.wait_for(asyncio.shield(poller), timeout)
+        except asyncio.TimeoutError:
+            return self.jobs.get(job_id, job)
+        except asyncio.CancelledError:
+            # The job was evicted and its poller cancelled; report what was last seen
+            if poller.cancelled() and not asyncio.current_task().cancelling():
+                return job
+            raise
+    
+    async def _poll(self, job_id: str, http_client: httpx.AsyncClient) -> Dict[str, Any]:
+        job = self.jobs[job_id]
+        interval = self.initial_interval
+        deadline = time.monotonic() + self.max_tracking_seconds
+        while time.monotonic() < deadline:
+            try:
+                response = await http_client.get(f"{job['ffcreator_instance']}/api/jobs/{job_id}", timeout=10)
+                response.raise_for_status()
+                state = response.json()
+            except Exception as e:
+                logger.warning(f"Polling FFCreator job {job_id} failed: {str(e)}")
+                state = None
+            
+            if state:
+                progressed = state.get("progress") != job["progress"] or state.get("status") != job["status"]
+                self._update(job, state)
+                if job["status"] in self.TERMINAL_STATES:
+                    return job
+            else:
+                progressed = False
+            
+            # Poll quickly while the render moves, back off while it sits in the queue or stalls
+            interval = self.initial_interval if progressed else min(interval * 2, self.max_interval)
+            await asyncio.sleep(interval)
+        
+        logger.warning(f"Stopped tracking FFCreator job {job_id} after {self.max_tracking_seconds}s")
+        return job
+    
+    @staticmethod
+    def _update(job: Dict[str, Any], state: Dict[str, Any]):
+        job["status"] = state.get("status", job["status"])
+        job["progress"] = state.get("progress", job["progress"])
+        if state.get("error"):
+            job["error"] = state["error"]
+        if state.get("downloadUrl"):
+            job["download_url"] = state["downloadUrl"]
+            job["output_path"] = os.path.join(Config.FFCREATOR_OUTPUT_DIR, os.path.basename(state["downloadUrl"]))
+        if job["status"] in FFCreatorJobTracker.TERMINAL_STATES and "render_seconds" not in job:
+            try:
+                created = datetime.fromisoformat(state["createdAt"].replace("Z", "+00:00"))
+                completed = datetime.fromisoformat(state["completedAt"].replace("Z", "+00:00"))
+                job["render_seconds"] = round((completed - created).total_seconds(), 3)
+            except (KeyError, TypeError, AttributeError, ValueError):
+                job["render_seconds"] = round(time.time() - job["tracking_started"], 3)
+
+class ComfyUIInstance:
+    """Sampled load state of a single ComfyUI endpoint"""
+    
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.queue_running = 0
+        self.queue_pending = 0
+        self.vram_free: Optional[int] = None
+        self.vram_total: Optional[int] = None
+        self.healthy = True
+        self.draining = False
+        self.last_checkpoint: Optional[str] = None
+        self.last_sampled: Optional[float] = None
+        self.probes = ProbeHistory(Config.PROBE_HISTORY_SIZE)
+    
+    @property
+    def queue_depth(self) -> int:
+        return self.queue_running + self.queue_pending
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "status": "draining" if self.draining else ("healthy" if self.healthy else "unreachable"),
+            "queue_running": self.queue_running,
+            "queue_pending": self.queue_pending,
+            "vram_free_mb": self.vram_free // (1024 * 1024) if self.vram_free is not None else None,
+            "vram_total_mb": self.vram_total // (1024 * 1024) if self.vram_total is not None else None,
+            "last_checkpoint": self.last_checkpoint,
+            "last_sampled": datetime.fromtimestamp(self.last_sampled).isoformat() if self.last_sampled else None,
+            "latency": self.probes.stats()
+        }
+
+class ComfyUIPromptState:
+    """Latest known state of one prompt, plus a short ring buffer of its recent events"""
+    
+    def __init__(self, prompt_id: str, history_size: int):
+        self.prompt_id = prompt_id
+        self.status = "queued"
+        self.node: Optional[str] = None
+        self.progress: Optional[Dict[str, int]] = None
+        self.outputs: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self.preview: Optional[bytes] = None
+        self.preview_format: Optional[str] = None
+        self.events: deque = deque(maxlen=history_size)
+        self.updated = time.time()
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ("success", "error", "interrupted")
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "prompt_id": self.prompt_id,
+            "status": self.status,
+            "node": self.node,
+            "progress": self.progress,
+            "outputs": self.outputs,
+            "error": self.error,
+            "preview_bytes": len(self.preview) if self.preview else 0,
+            "preview_format": self.preview_format,
+            "updated": datetime.fromtimestamp(self.updated).isoformat()
+        }
+
+class ComfyUIEventStream:
+    """One long-lived /ws connection per ComfyUI instance, demultiplexed by prompt_id"""
+    
+    # Binary frame header: 4-byte event type, then 4-byte image format (big endian)
+    BINARY_PREVIEW_IMAGE = 1
+    IMAGE_FORMATS = {1: "jpeg", 2: "png"}
+    
+    def __init__(self, instance: "ComfyUIInstance", max_prompts: int, history_size: int):
+        self.instance = instance
+        self.client_id = str(uuid.uuid4())
+        self.max_prompts = max_prompts
+        self.history_size = history_size
+        self.prompts: "OrderedDict[str, ComfyUIPromptState]" = OrderedDict()
+        self.connected = False
+        self._waiters: Dict[str, Set[asyncio.Queue]] = {}
+        self._executing_prompt: Optional[str] = None
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def ws_url(self) -> str:
+        scheme, rest = self.instance.url.split("://", 1)
+        return f"{'wss' if scheme == 'https' else 'ws'}://{rest}/ws?clientId={self.client_id}"
+    
+    def start(self, http_client: httpx.AsyncClient):
+        self.http_client = http_client
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                async with websockets.connect(self.ws_url, max_size=None) as socket:
+                    self.connected = True
+                    backoff = 1.0
+                    logger.info(f"Connected to ComfyUI event stream at {self.instance.url}")
+                    # Completions sent while disconnected are gone; recover them from /history
+                    await asyncio.gather(*(self.refresh_from_history(prompt_id) for prompt_id in list(self._waiters)))
+                    async for message in socket:
+                        if isinstance(message, bytes):
+                            self._handle_binary(message)
+                        else:
+                            self._handle_event(json.loads(message))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"ComfyUI event stream {self.instance.url} disconnected: {str(e)}")
+            self.connected = False
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+    
+    def get_state(self, prompt_id: str) -> ComfyUIPromptState:
+        state = self.prompts.get(prompt_id)
+        if state is None:
+            state = ComfyUIPromptState(prompt_id, self.history_size)
+            self.prompts[prompt_id] = state
+            while len(self.prompts) > self.max_prompts:
+                self.prompts.popitem(last=False)
+        return state
+    
+    def _handle_event(self, message: Dict[str, Any]):
+        event_type = message.get("type")
+        data = message.get("data") or {}
+        
+        if event_type == "status":
+            queue_remaining = data.get("status", {}).get("exec_info", {}).get("queue_remaining")
+            if queue_remaining is not None:
+                self.instance.queue_running = min(1, queue_remaining)
+                self.instance.queue_pending = max(0, queue_remaining - 1)
+            return
+        
+        prompt_id = data.get("prompt_id")
+        if not prompt_id:
+            return
+        state = self.get_state(prompt_id)
+        
+        if event_type == "execution_start":
+            state.status = "running"
+            self._executing_prompt = prompt_id
+        elif event_type == "executing":
+            state.node = data.get("node")
+            if state.node is None:
+                # ComfyUI signals the end of a prompt with executing(node=None), also after an
+                # error or interruption, which must not be turned into a success
+                if not state.finished:
+                    state.status = "success"
+                self._executing_prompt = None
+            else:
+                state.status = "running"
+                self._executing_prompt = prompt_id
+        elif event_type == "progress":
+            state.progress = {"value": data.get("value"), "max": data.get("max")}
+        elif event_type == "executed":
+            state.outputs.extend((data.get("output") or {}).get("images", []))
+        elif event_type == "execution_success":
+            state.status = "success"
+        elif event_type == "execution_error":
+            state.status = "error"
+            state.error = data.get("exception_message")
+        elif event_type == "execution_interrupted":
+            state.status = "interrupted"
+        
+        state.updated = time.time()
+        state.events.append({"type": event_type, "data": data})
+        self._publish(state, message)
+    
+    def _handle_binary(self, message: bytes):
+        """Preview frames (and SaveImageWebsocket output) carry no prompt_id; they belong to the running prompt"""
+        if len(message) < 8 or self._executing_prompt is None:
+            return
+        event_type, image_format = struct.unpack(">II", message[:8])
+        if event_type != self.BINARY_PREVIEW_IMAGE:
+            return
+        state = self.get_state(self._executing_prompt)
+        state.preview = message[8:]
+        state.preview_format = self.IMAGE_FORMATS.get(image_format, "unknown")
+        state.updated = time.time()
+        self._publish(state, {"type": "preview", "data": {"prompt_id": state.prompt_id, "format": state.preview_format}})
+    
+    def _publish(self, state: ComfyUIPromptState, event: Dict[str, Any]):
+        for queue in self._waiters.get(state.prompt_id, ()):
+            queue.put_nowait(event)
+    
+    async def refresh_from_history(self, prompt_id: str):
+        """Resolve a prompt from /history when its completion events may have been missed"""
+        state = self.get_state(prompt_id)
+        if state.finished or self.http_client is None:
+            return
+        try:
+            response = await self.http_client.get(f"{self.instance.url}/history/{prompt_id}", timeout=5)
+            response.raise_for_status()
+            history = response.json().get(prompt_id)
+        except Exception as e:
+            logger.warning(f"Could not read ComfyUI history for {prompt_id} on {self.instance.url}: {str(e)}")
+            return
+        if not history or state.finished:
+            return
+        status = history.get("status", {})
+        if status.get("status_str") == "error":
+            state.status = "error"
+            for message_type, data in status.get("messages", []):
+                if message_type == "execution_error":
+                    state.error = data.get("exception_message")
+        elif status.get("completed", True):
+            state.status = "success"
+        else:
+            return
+        state.node = None
+        state.outputs = [
+            image
+            for node_output in history.get("outputs", {}).values()
+            for image in node_output.get("images", [])
+        ]
+        state.updated = time.time()
+        event = {"type": "history", "data": {"prompt_id": prompt_id, "status": state.status}}
+        state.events.append(event)
+        self._publish(state, event)
+    
+    @asynccontextmanager
+    async def subscribe(self, prompt_id: str):
+        """Queue of raw events for a prompt; the caller reads the buffered state first via get_state"""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._waiters.setdefault(prompt_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            waiters = self._waiters.get(prompt_id)
+            if waiters is not None:
+                waiters.discard(queue)
+                if not waiters:
+                    del self._waiters[prompt_id]
+    
+    async def wait_for_completion(self, prompt_id: str, timeout: float) -> ComfyUIPromptState:
+        """Wait until a prompt succeeds, fails or is interrupted; on timeout return its current state"""
+        state = self.get_state(prompt_id)
+        if state.finished:
+            return state
+        async with self.subscribe(prompt_id) as queue:
+            deadline = time.monotonic() + timeout
+            while not state.finished:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    # Last chance for a completion the stream missed
+                    await self.refresh_from_history(prompt_id)
+                    break
+        return state
+
+class ComfyUIPool:
+    """Routes image generation across several ComfyUI instances by queue depth and free VRAM"""
+    
+    def __init__(self, urls: List[str], sample_interval: float, min_free_vram_mb: int, sticky_slack: int):
+        self.instances = [ComfyUIInstance(url) for url in urls]
+        self.event_streams = {
+            instance.url: ComfyUIEventStream(instance, Config.COMFYUI_EVENT_PROMPTS, Config.COMFYUI_EVENT_HISTORY)
+            for instance in self.instances
+        }
+        self.sample_interval = sample_interval
+        self.min_free_vram = min_free_vram_mb * 1024 * 1024
+        self.sticky_slack = sticky_slack
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def get_instance(self, url: str) -> Optional[ComfyUIInstance]:
+        url = url.rstrip("/")
+        return next((instance for instance in self.instances if instance.url == url), None)
+    
+    def start(self, http_client: httpx.AsyncClient):
+        """Start periodic sampling and the event stream of every instance"""
+        self.http_client = http_client
+        for stream in self.event_streams.values():
+            stream.start(http_client)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop periodic sampling and close the event streams"""
+        for stream in self.event_streams.values():
+            await stream.stop()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        while True:
+            await self.sample()
+            await asyncio.sleep(self.sample_interval)
+    
+    async def sample(self):
+        """Refresh queue and VRAM figures for all instances concurrently"""
+        await asyncio.gather(*(self._sample_instance(instance) for instance in self.instances))
+    
+    async def _sample_instance(self, instance: ComfyUIInstance):
+        started = time.monotonic()
+        try:
+            # Only the /queue round trip counts as probe latency; system_stats is bookkeeping
+            try:
+                queue_response = await self.http_client.get(f"{instance.url}/queue", timeout=5)
+                queue_response.raise_for_status()
+                queue = queue_response.json()
+            except Exception:
+                instance.probes.record((time.monotonic() - started) * 1000, False)
+                raise
+            instance.probes.record((time.monotonic() - started) * 1000, True)
+            stats_response = await self.http_client.get(f"{instance.url}/system_stats", timeout=5)
+            stats_response.raise_for_status()
+            devices = stats_response.json().get("devices", [])
+        except Exception as e:
+            if instance.healthy:
+                logger.warning(f"ComfyUI instance {instance.url} unreachable: {str(e)}")
+            instance.healthy = False
+            return
+        
+        instance.queue_running = len(queue.get("queue_running", []))
+        instance.queue_pending = len(queue.get("queue_pending", []))
+        if devices:
+            instance.vram_free = max(device.get("vram_free", 0) for device in devices)
+            instance.vram_total = max(device.get("vram_total", 0) for device in devices)
+        instance.healthy = True
+        instance.last_sampled = time.time()
+    
+    def set_draining(self, url: str, draining: bool) -> ComfyUIInstance:
+        """Take an instance out of (or back into) rotation without touching queued work"""
+        instance = self.get_instance(url)
+        if instance is None:
+            raise ValueError(f"Unknown ComfyUI instance: {url}")
+        instance.draining = draining
+        logger.info(f"ComfyUI instance {instance.url} {'draining' if draining else 'back in rotation'}")
+        return instance
+    
+    def route(self, checkpoint: Optional[str] = None) -> ComfyUIInstance:
+        """Pick the instance for the next prompt and account for it in the local queue estimate"""
+        available = [i for i in self.instances if i.healthy and not i.draining]
+        if not available:
+            raise RuntimeError("No ComfyUI instance available (all draining or unreachable)")
+        
+        candidates = [i for i in available if i.vram_free is None or i.vram_free >= self.min_free_vram]
+        if not candidates:
+            logger.warning("No ComfyUI instance has enough free VRAM, routing by queue depth only")
+            candidates = available
+        
+        chosen = min(candidates, key=lambda i: i.queue_depth)
+        if checkpoint:
+            # Prefer an instance that already has the checkpoint loaded unless its queue is much longer
+            warm = [i for i in candidates if i.last_checkpoint == checkpoint]
+            if warm:
+                best_warm = min(warm, key=lambda i: i.queue_depth)
+                if best_warm.queue_depth <= chosen.queue_depth + self.sticky_slack:
+                    chosen = best_warm
+            chosen.last_checkpoint = checkpoint
+        
+        chosen.queue_pending += 1
+        return chosen
+    
+    def status(self) -> List[Dict[str, Any]]:
+        return [
+            {**instance.to_dict(), "event_stream_connected": self.event_streams[instance.url].connected}
+            for instance in self.instances
+        ]
+
+class GenerationCache:
+    """Maps a canonical hash of a seeded ComfyUI graph to the files it produced"""
+    
+    def __init__(self, index_path: str, output_dir: str, max_entries: int, pending_ttl: float):
+        self.index_path = index_path
+        self.output_dir = output_dir
+        self.max_entries = max_entries
+        self.pending_ttl = pending_ttl
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._load()
+    
+    @staticmethod
+    def make_key(graph: Dict[str, Any]) -> str:
+        """Canonical hash: key order and whitespace never change the key"""
+        canonical = json.dumps(graph, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the entry for a key, evicting it if its files or pending prompt are gone"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.get("files"):
+            if not all(os.path.exists(path) for path in entry["files"]):
+                logger.info(f"Generation cache entry {key[:12]} lost its files, evicting")
+                self.evict(key)
+                return None
+        elif time.time() - entry["submitted_at"] > self.pending_ttl:
+            self.evict(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+    
+    def record_pending(self, key: str, comfyui_instance: str, prompt_id: str):
+        """Remember a submitted prompt until its outputs can be resolved"""
+        self.entries[key] = {
+            "comfyui_instance": comfyui_instance,
+            "prompt_id": prompt_id,
+            "submitted_at": time.time(),
+            "files": []
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self._save()
+    
+    def record_outputs(self, key: str, outputs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Attach ComfyUI output descriptors (filename/subfolder) as paths on the output volume"""
+        entry = self.entries[key]
+        entry["files"] = [
+            os.path.join(self.output_dir, output.get("subfolder", ""), output["filename"])
+            for output in outputs
+        ]
+        self._save()
+        return entry
+    
+    def evict(self, key: str):
+        if self.entries.pop(key, None) is not None:
+            self._save()
+    
+    def prune(self) -> int:
+        """Drop every completed entry whose files were deleted from the output volume"""
+        stale = [
+            key for key, entry in self.entries.items()
+            if entry.get("files") and not all(os.path.exists(path) for path in entry["files"])
+        ]
+        for key in stale:
+            del self.entries[key]
+        if stale:
+            self._save()
+        return len(stale)
+    
+    def _load(self):
+        try:
+            with open(self.index_path, "r") as f:
+                self.entries = OrderedDict(json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable generation cache index {self.index_path}: {str(e)}")
+    
+    def _save(self):
+        try:
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.warning(f"Could not persist generation cache index: {str(e)}")
+
+class ToolBusyError(Exception):
+    """Raised when a tool call is rejected instead of queued"""
+    
+    def __init__(self, details: Dict[str, Any]):
+        super().__init__(f"Server busy: {details['reason']}")
+        self.details = details
+
+class ToolAdmission:
+    """Bounded queue in front of tool dispatch with a concurrency cap per tool
+    
+    Calls over a tool's cap wait in a shared queue of at most max_queue calls. A call that finds
+    the queue full, or that would wait longer than max_wait, is rejected at once with the queue
+    depth and a retry-after hint derived from recent call durations. Tools that submit a job and
+    then wait for it call release_slot() after submitting, so waiting never holds a slot.
+    """
+    
+    _current_release: contextvars.ContextVar = contextvars.ContextVar("tool_admission_release", default=None)
+    
+    def __init__(self, caps: Dict[str, int], default_cap: int, max_queue: int, max_wait: float):
+        self.caps = caps
+        self.default_cap = default_cap
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.queued = 0
+        self.rejected = 0
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._waiting: Dict[str, int] = {}
+        self._running: Dict[str, int] = {}
+        # Exponentially weighted mean call duration per tool, seeds the retry-after hint
+        self._durations: Dict[str, float] = {}
+    
+    def cap(self, tool: str) -> int:
+        return self.caps.get(tool, self.default_cap)
+    
+    @asynccontextmanager
+    async def admit(self, tool: str):
+        semaphore = self._semaphores.setdefault(tool, asyncio.Semaphore(self.cap(tool)))
+        if semaphore.locked():
+            if self.queued >= self.max_queue:
+                self._reject(tool, "queue full")
+            self.queued += 1
+            self._waiting[tool] = self._waiting.get(tool, 0) + 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                self._reject(tool, "queue wait exceeded")
+            finally:
+                self.queued -= 1
+                self._waiting[tool] -= 1
+        else:
+            await semaphore.acquire()
+        
+        self._running[tool] = self._running.get(tool, 0) + 1
+        started = time.monotonic()
+        released = False
+        
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            self._running[tool] -= 1
+            semaphore.release()
+            elapsed = time.monotonic() - started
+            previous = self._durations.get(tool)
+            self._durations[tool] = elapsed if previous is None else 0.8 * previous + 0.2 * elapsed
+        
+        token = self._current_release.set(release)
+        try:
+            yield
+        finally:
+            self._current_release.reset(token)
+            release()
+    
+    def release_slot(self):
+        """Give back the slot of the call running in this context early; a no-op outside admission"""
+        release = self._current_release.get()
+        if release is not None:
+            release()
+    
+    def _reject(self, tool: str, reason: str):
+        self.rejected += 1
+        # Time for the calls ahead of this one to drain through the tool's slots
+        ahead = self._running.get(tool, 0) + self._waiting.get(tool, 0)
+        estimate = self._durations.get(tool, 1.0) * max(ahead, 1) / self.cap(tool)
+        raise ToolBusyError({
+            "error": "server_busy",
+            "reason": reason,
+            "tool": tool,
+            "queue_depth": self.queued,
+            "max_queue": self.max_queue,
+            "tool_in_flight": self._running.get(tool, 0),
+            "tool_queued": self._waiting.get(tool, 0),
+            "tool_concurrency": self.cap(tool),
+            "retry_after_seconds": min(max(1, round(estimate)), 120)
+        })
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queued,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "tools": {
+                tool: {
+                    "in_flight": self._running.get(tool, 0),
+                    "queued": self._waiting.get(tool, 0),
+                    "concurrency": self.cap(tool),
+                    "mean_seconds": round(self._durations[tool], 3) if tool in self._durations else None
+                }
+                for tool in self._semaphores
+            }
+        }
+
+# Tools that start expensive work and therefore accept an idempotency_key
+IDEMPOTENT_TOOLS = {"execute_workflow", "generate_image", "create_video"}
+
 class N8NMCPServer:
     """Main MCP Server class for N8N AI Studio control"""
     
     def __init__(self):
         self.server = Server(Config.SERVER_NAME)
         self.http_client = None
+        self.offload = OffloadExecutor(
+            Config.OFFLOAD_SIZE_THRESHOLD,
+            Config.OFFLOAD_PROCESS_WORKERS,
+            Config.OFFLOAD_THREAD_WORKERS
+        )
+        self.loop_lag = EventLoopLagMonitor(Config.LOOP_LAG_INTERVAL, Config.LOOP_LAG_WINDOW)
+        self.resource_monitor = ResourceMonitor(self, Config.RESOURCE_MONITOR_INTERVAL)
+        self.idempotency_store = None
+        self.cache = TieredCache(
+            Config.REDIS_URL if Config.CACHE_REDIS_ENABLED else None,
+            Config.CACHE_L1_MAX_ENTRIES,
+            Config.CACHE_LOCK_TIMEOUT
+        )
+        self._idempotent_calls: Dict[str, Tuple[asyncio.Task, str]] = {}
+        self.tool_admission = ToolAdmission(
+            Config.TOOL_CONCURRENCY,
+            Config.TOOL_DEFAULT_CONCURRENCY,
+            Config.TOOL_QUEUE_SIZE,
+            Config.TOOL_QUEUE_MAX_WAIT
+        )
+        self.asset_index = AssetIndex(
+            Config.ASSET_INDEX_PATH,
+            (Config.COMFYUI_OUTPUT_DIR, Config.FFCREATOR_OUTPUT_DIR, Config.KOKORO_OUTPUT_DIR),
+            Config.ASSET_INDEX_INTERVAL,
+            Config.ASSET_METADATA_WORKERS
+        )
+        self.deduplicator = OutputDeduplicator(
+            Config.DEDUP_INDEX_PATH,
+            (Config.COMFYUI_OUTPUT_DIR, Config.FFCREATOR_OUTPUT_DIR, Config.KOKORO_OUTPUT_DIR),
+            Config.DEDUP_MIN_SIZE,
+            Config.DEDUP_INTERVAL
+        )
+        self.comfyui_pool = ComfyUIPool(
+            Config.COMFYUI_BASE_URLS,
+            Config.COMFYUI_SAMPLE_INTERVAL,
+            Config.COMFYUI_MIN_FREE_VRAM_MB,
+            Config.COMFYUI_STICKY_QUEUE_SLACK
+        )
+        self.n8n_probes = ProbeHistory(Config.PROBE_HISTORY_SIZE)
+        self.generation_cache = GenerationCache(
+            Config.GENERATION_CACHE_PATH,
+            Config.COMFYUI_OUTPUT_DIR,
+            Config.GENERATION_CACHE_MAX_ENTRIES,
+            Config.GENERATION_CACHE_PENDING_TTL
+        )
+        self.ffcreator_replicas = ReplicaSet(
+            "ffcreator", Config.FFCREATOR_BASE_URLS, Config.REPLICA_MAX_FAILURES, Config.REPLICA_EJECTION_SECONDS
+        )
+        self.video_jobs = FFCreatorJobTracker(
+            Config.FFCREATOR_POLL_INITIAL_INTERVAL,
+            Config.FFCREATOR_POLL_MAX_INTERVAL,
+            Config.FFCREATOR_JOB_MAX_TRACKING_SECONDS
+        )
+        self.kokoro_replicas = ReplicaSet(
+            "kokoro", Config.KOKORO_BASE_URLS, Config.REPLICA_MAX_FAILURES, Config.REPLICA_EJECTION_SECONDS
+        )
         self.setup_handlers()
     
     async def __aenter__(self):
         """Async context manager entry"""
         self.http_client = httpx.AsyncClient(timeout=30.0)
+        if Config.IDEMPOTENCY_BACKEND == "redis":
+            self.idempotency_store = RedisIdempotencyStore(Config.REDIS_URL)
+        else:
+            self.idempotency_store = SQLiteIdempotencyStore(Config.IDEMPOTENCY_SQLITE_PATH)
+        pruned = self.generation_cache.prune()
+        if pruned:
+            logger.info(f"Pruned {pruned} generation cache entries whose outputs were deleted")
+        self.loop_lag.start()
+        self.cache.start()
+        self.asset_index.start()
+        self.deduplicator.start(self.offload)
+        self.comfyui_pool.start(self.http_client)
+        self.resource_monitor.start()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Async context manager exit - cleanup resources"""
+        await self.resource_monitor.stop()
+        await self.comfyui_pool.stop()
+        await self.video_jobs.stop()
+        await self.loop_lag.stop()
+        await self.cache.stop()
+        await self.asset_index.stop()
+        await self.deduplicator.stop()
+        self.offload.shutdown()
+        if self.idempotency_store:
+            await self.idempotency_store.close()
+            self.idempotency_store = None
         if self.http_client:
             await self.http_client.aclose()
             self.http_client = None
     
+    def get_capabilities(self):
+        """Server capabilities, advertising resource subscriptions"""
+        capabilities = self.server.get_capabilities(NotificationOptions(), {})
+        if capabilities.resources:
+            capabilities.resources.subscribe = True
+        return capabilities
+    
     def setup_handlers(self):
         """Setup MCP server handlers"""
         
@@ -129,6 +2161,10 @@ class N8NMCPServer:
                                 "type": "boolean",
                                 "description": "Wait for workflow execution to complete",
                                 "default": True
+                            },
+                            "idempotency_key": {
+                                "type": "string",
+                                "description": "Retries with the same key attach to the original run instead of starting a new one"
                             }
                         },
                         "required": ["workflow_id"]
@@ -194,11 +2230,64 @@ class N8NMCPServer:
                                 "type": "integer",
                                 "description": "Number of generation steps",
                                 "default": 20
+                            },
+                            "checkpoint": {
+                                "type": "string",
+                                "description": "Model checkpoint; prompts for the same checkpoint stick to one ComfyUI instance",
+                                "default": ""
+                            },
+                            "loras": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "LoRAs to apply",
+                                "default": []
+                            },
+                            "sampler": {
+                                "type": "string",
+                                "description": "Sampler name",
+                                "default": "euler"
+                            },
+                            "seed": {
+                                "type": "integer",
+                                "description": "Explicit seed; identical seeded requests reuse the existing output instead of re-rendering"
+                            },
+                            "wait_for_completion": {
+                                "type": "boolean",
+                                "description": "Wait for ComfyUI to finish the prompt and return its output files",
+                                "default": False
+                            },
+                            "timeout": {
+                                "type": "number",
+                                "description": "Seconds to wait when wait_for_completion is set",
+                                "default": 300
+                            },
+                            "idempotency_key": {
+                                "type": "string",
+                                "description": "Retries with the same key attach to the original run instead of starting a new one"
                             }
                         },
                         "required": ["prompt"]
                     }
                 ),
+                Tool(
+                    name="set_comfyui_drain",
+                    description="Put a ComfyUI instance into (or take it out of) drain mode for maintenance",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "instance_url": {
+                                "type": "string",
+                                "description": "Base URL of the ComfyUI instance, as listed in get_service_status"
+                            },
+                            "drain": {
+                                "type": "boolean",
+                                "description": "True to stop routing new work to the instance, False to resume",
+                                "default": True
+                            }
+                        },
+                        "required": ["instance_url"]
+                    }
+                ),
                 Tool(
                     name="create_video",
                     description="Create a video using FFCreator with images, text, and audio",
@@ -229,11 +2318,49 @@ class N8NMCPServer:
                                 "enum": ["fade", "slide", "zoom", "none"],
                                 "description": "Transition effect between images",
                                 "default": "fade"
+                            },
+                            "wait_for_completion": {
+                                "type": "boolean",
+                                "description": "Wait for the render to finish and return the output path and render time",
+                                "default": False
+                            },
+                            "timeout": {
+                                "type": "number",
+                                "description": "Seconds to wait when wait_for_completion is set",
+                                "default": 600
+                            },
+                            "idempotency_key": {
+                                "type": "string",
+                                "description": "Retries with the same key attach to the original run instead of starting a new one"
                             }
                         },
                         "required": ["title", "images"]
                     }
                 ),
+                Tool(
+                    name="get_video_job",
+                    description="Get the progress of an FFCreator render job, optionally waiting for it to finish",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "job_id": {
+                                "type": "string",
+                                "description": "Job id returned by create_video"
+                            },
+                            "wait_for_completion": {
+                                "type": "boolean",
+                                "description": "Wait for the render to finish",
+                                "default": False
+                            },
+                            "timeout": {
+                                "type": "number",
+                                "description": "Seconds to wait when wait_for_completion is set",
+                                "default": 600
+                            }
+                        },
+                        "required": ["job_id"]
+                    }
+                ),
                 Tool(
                     name="synthesize_speech",
                     description="Generate speech audio using Kokoro TTS",
@@ -259,6 +2386,16 @@ class N8NMCPServer:
                                 "enum": ["wav", "mp3"],
                                 "description": "Output audio format",
                                 "default": "wav"
+                            },
+                            "long_text": {
+                                "type": "boolean",
+                                "description": "Split the text at sentence/paragraph boundaries, synthesize chunks concurrently and stitch them into one WAV file (output_format must be wav)",
+                                "default": False
+                            },
+                            "word_timings": {
+                                "type": "boolean",
+                                "description": "Write word-level karaoke timings as JSON next to the WAV output (output_format must be wav)",
+                                "default": False
                             }
                         },
                         "required": ["text"]
@@ -266,13 +2403,13 @@ class N8NMCPServer:
                 ),
                 Tool(
                     name="get_service_status",
-                    description="Check the status of all AI services (N8N, ComfyUI, FFCreator, Kokoro)",
+                    description="Check the status of all AI services (N8N, ComfyUI, FFCreator, Kokoro) with rolling probe latency (p50/p95), error rate and time since last failure",
                     inputSchema={
                         "type": "object",
                         "properties": {
                             "service": {
                                 "type": "string",
-                                "enum": ["all", "n8n", "comfyui", "ffcreator", "kokoro"],
+                                "enum": ["all", "n8n", "comfyui", "ffcreator", "kokoro", "mcp_server"],
                                 "description": "Which service to check",
                                 "default": "all"
                             }
@@ -281,7 +2418,7 @@ class N8NMCPServer:
                 ),
                 Tool(
                     name="list_generated_assets",
-                    description="List generated assets (images, videos, audio) from the AI services",
+                    description="List generated assets (images, videos, audio) from the AI services, with dimensions and durations",
                     inputSchema={
                         "type": "object",
                         "properties": {
@@ -298,6 +2435,38 @@ class N8NMCPServer:
                             }
                         }
                     }
+                ),
+                Tool(
+                    name="deduplicate_assets",
+                    description="Hardlink byte-identical generated files to a single copy and report the disk space reclaimed",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "dry_run": {
+                                "type": "boolean",
+                                "description": "Only report duplicates without replacing any files",
+                                "default": False
+                            }
+                        }
+                    }
+                ),
+                Tool(
+                    name="extract_word_timings",
+                    description="Align a script with a WAV file and write word-level karaoke timings next to it",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "audio_path": {
+                                "type": "string",
+                                "description": "Path to a 16-bit PCM WAV file"
+                            },
+                            "text": {
+                                "type": "string",
+                                "description": "The script spoken in the audio"
+                            }
+                        },
+                        "required": ["audio_path", "text"]
+                    }
                 )
             ]
         
@@ -307,41 +2476,19 @@ class N8NMCPServer:
             try:
                 logger.info(f"Calling tool: {name} with arguments: {arguments}")
                 
-                if name == "list_workflows":
-                    return await self.list_workflows(arguments.get("active_only", False))
-                elif name == "get_workflow":
-                    return await self.get_workflow(arguments["workflow_id"])
-                elif name == "execute_workflow":
-                    return await self.execute_workflow(
-                        arguments["workflow_id"],
-                        arguments.get("input_data", {}),
-                        arguments.get("wait_for_completion", True)
-                    )
-                elif name == "create_multimodal_workflow":
-                    return await self.create_multimodal_workflow(
-                        arguments["name"],
-                        arguments.get("description", ""),
-                        arguments["workflow_type"],
-                        arguments["components"]
-                    )
-                elif name == "generate_image":
-                    return await self.generate_image(arguments)
-                elif name == "create_video":
-                    return await self.create_video(arguments)
-                elif name == "synthesize_speech":
-                    return await self.synthesize_speech(arguments)
-                elif name == "get_service_status":
-                    return await self.get_service_status(arguments.get("service", "all"))
-                elif name == "list_generated_assets":
-                    return await self.list_generated_assets(
-                        arguments.get("asset_type", "all"),
-                        arguments.get("limit", 20)
-                    )
-                else:
-                    return CallToolResult(
-                        content=[TextContent(type="text", text=f"Unknown tool: {name}")]
-                    )
+                idempotency_key = arguments.pop("idempotency_key", None)
+                if idempotency_key and name in IDEMPOTENT_TOOLS:
+                    # Admitted only if it runs; retries that replay or attach take no slot
+                    return await self._call_idempotent(name, idempotency_key, arguments)
+                async with self.tool_admission.admit(name):
+                    return await self._dispatch_tool(name, arguments)
                     
+            except ToolBusyError as e:
+                logger.warning(f"Rejected tool {name}: {e.details['reason']} (queue depth {e.details['queue_depth']})")
+                return CallToolResult(
+                    content=[TextContent(type="text", text=json.dumps(e.details, indent=2))],
+                    isError=True
+                )
             except Exception as e:
                 logger.error(f"Error calling tool {name}: {str(e)}")
                 return CallToolResult(
@@ -372,24 +2519,41 @@ class N8NMCPServer:
                 )
             ]
         
+        @self.server.subscribe_resource()
+        async def handle_subscribe_resource(uri: AnyUrl) -> None:
+            """Subscribe the calling session to resource update notifications"""
+            session = self.server.request_context.session
+            self.resource_monitor.subscribe(str(uri), session)
+        
+        @self.server.unsubscribe_resource()
+        async def handle_unsubscribe_resource(uri: AnyUrl) -> None:
+            """Stop sending resource update notifications to the calling session"""
+            session = self.server.request_context.session
+            self.resource_monitor.unsubscribe(str(uri), session)
+        
         @self.server.read_resource()
         async def handle_read_resource(uri: str) -> ReadResourceResult:
             """Read resource content"""
             try:
+                uri = str(uri)
                 if uri == "n8n://workflows":
                     workflows = await self._get_n8n_workflows()
                     return ReadResourceResult(
-                        contents=[TextContent(type="text", text=json.dumps(workflows, indent=2))]
+                        contents=[TextContent(type="text", text=await self.offload.dumps(workflows, indent=2))]
                     )
                 elif uri == "assets://generated":
-                    assets = await self._get_generated_assets()
+                    assets = self.resource_monitor.get_snapshot(uri)
+                    if assets is None:
+                        assets = await self._get_generated_assets()
                     return ReadResourceResult(
-                        contents=[TextContent(type="text", text=json.dumps(assets, indent=2))]
+                        contents=[TextContent(type="text", text=await self.offload.dumps(assets, indent=2))]
                     )
                 elif uri == "services://status":
-                    status = await self._get_all_service_status()
+                    status = self.resource_monitor.get_snapshot(uri)
+                    if status is None:
+                        status = await self._get_all_service_status()
                     return ReadResourceResult(
-                        contents=[TextContent(type="text", text=json.dumps(status, indent=2))]
+                        contents=[TextContent(type="text", text=await self.offload.dumps(status, indent=2))]
                     )
                 else:
                     return ReadResourceResult(
@@ -401,6 +2565,132 @@ class N8NMCPServer:
                     contents=[TextContent(type="text", text=f"Error: {str(e)}")]
                 )
     
+    async def _dispatch_tool(self, name: str, arguments: Dict[str, Any]) -> CallToolResult:
+        """Route a tool call to its implementation"""
+        if name == "list_workflows":
+            return await self.list_workflows(arguments.get("active_only", False))
+        elif name == "get_workflow":
+            return await self.get_workflow(arguments["workflow_id"])
+        elif name == "execute_workflow":
+            return await self.execute_workflow(
+                arguments["workflow_id"],
+                arguments.get("input_data", {}),
+                arguments.get("wait_for_completion", True)
+            )
+        elif name == "create_multimodal_workflow":
+            return await self.create_multimodal_workflow(
+                arguments["name"],
+                arguments.get("description", ""),
+                arguments["workflow_type"],
+                arguments["components"]
+            )
+        elif name == "generate_image":
+            return await self.generate_image(arguments)
+        elif name == "set_comfyui_drain":
+            return await self.set_comfyui_drain(
+                arguments["instance_url"],
+                arguments.get("drain", True)
+            )
+        elif name == "create_video":
+            return await self.create_video(arguments)
+        elif name == "get_video_job":
+            return await self.get_video_job(
+                arguments["job_id"],
+                arguments.get("wait_for_completion", False),
+                arguments.get("timeout", 600)
+            )
+        elif name == "synthesize_speech":
+            return await self.synthesize_speech(arguments)
+        elif name == "get_service_status":
+            return await self.get_service_status(arguments.get("service", "all"))
+        elif name == "list_generated_assets":
+            return await self.list_generated_assets(
+                arguments.get("asset_type", "all"),
+                arguments.get("limit", 20)
+            )
+        elif name == "deduplicate_assets":
+            return await self.deduplicate_assets(arguments.get("dry_run", False))
+        elif name == "extract_word_timings":
+            return await self.extract_word_timings(arguments["audio_path"], arguments["text"])
+        else:
+            return CallToolResult(
+                content=[TextContent(type="text", text=f"Unknown tool: {name}")]
+            )
+    
+    async def _call_idempotent(self, name: str, idempotency_key: str, arguments: Dict[str, Any]) -> CallToolResult:
+        """Run a side-effecting tool at most once per key, replaying or attaching on retries"""
+        key = f"{name}:{idempotency_key}"
+        arguments_hash = GenerationCache.make_key(arguments)
+        
+        # Same process: share the running call directly
+        running = self._idempotent_calls.get(key)
+        if running is not None:
+            task, running_hash = running
+            if running_hash != arguments_hash:
+                return self._idempotency_key_reused(key)
+            logger.info(f"Attaching retry for {key} to the in-flight call")
+            return await asyncio.shield(task)
+        
+        record = {"status": "running", "arguments_hash": arguments_hash, "started_at": time.time()}
+        if not await self.idempotency_store.claim(key, record, Config.IDEMPOTENCY_RUNNING_TTL):
+            return await self._attach_idempotent(key, arguments_hash)
+        
+        # The task records the outcome itself, so a caller that gives up doesn't leave the key "running"
+        task = asyncio.create_task(self._run_idempotent(key, record, name, arguments))
+        self._idempotent_calls[key] = (task, arguments_hash)
+        task.add_done_callback(lambda _: self._idempotent_calls.pop(key, None))
+        return await asyncio.shield(task)
+    
+    async def _run_idempotent(self, key: str, record: Dict[str, Any], name: str, arguments: Dict[str, Any]) -> CallToolResult:
+        try:
+            async with self.tool_admission.admit(name):
+                result = await self._dispatch_tool(name, arguments)
+        except BaseException:
+            await self.idempotency_store.delete(key)
+            raise
+        
+        if result.isError:
+            # Failures are not recorded so the client can retry with the same key
+            await self.idempotency_store.delete(key)
+        else:
+            text = result.content[0].text if result.content else ""
+            record.update({"status": "completed", "result": text, "completed_at": time.time()})
+            await self.idempotency_store.set(key, record, Config.IDEMPOTENCY_TTL)
+        return result
+    
+    async def _attach_idempotent(self, key: str, arguments_hash: str) -> CallToolResult:
+        """Wait for a call claimed elsewhere (another replica or an earlier process) to finish"""
+        deadline = time.monotonic() + Config.IDEMPOTENCY_ATTACH_TIMEOUT
+        interval = 0.5
+        while True:
+            record = await self.idempotency_store.get(key)
+            if record is None:
+                return CallToolResult(
+                    content=[TextContent(type="text", text=f"Error: the original call for idempotency key {key} failed or expired; retry with the same key")],
+                    isError=True
+                )
+            if record["arguments_hash"] != arguments_hash:
+                return self._idempotency_key_reused(key)
+            if record["status"] == "completed":
+                return CallToolResult(content=[TextContent(type="text", text=record["result"])])
+            if time.monotonic() >= deadline:
+                status = {
+                    "idempotency_key": key,
+                    "status": "running",
+                    "started_at": datetime.fromtimestamp(record["started_at"]).isoformat()
+                }
+                return CallToolResult(
+                    content=[TextContent(type="text", text=f"Original call still in progress: {json.dumps(status, indent=2)}")]
+                )
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, 5.0)
+    
+    def _idempotency_key_reused(self, key: str) -> CallToolResult:
+        return CallToolResult(
+            content=[TextContent(type="text", text=f"Error: idempotency key {key} was already used with different arguments")],
+            isError=True
+        )
+    
     # Tool implementation methods
     async def list_workflows(self, active_only: bool = False) -> CallToolResult:
         """List N8N workflows"""
@@ -415,7 +2705,7 @@ class N8NMCPServer:
             }
             
             return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(result, indent=2))]
+                content=[TextContent(type="text", text=await self.offload.dumps(result, indent=2))]
             )
         except Exception as e:
             return CallToolResult(
@@ -425,15 +2715,17 @@ class N8NMCPServer:
     async def get_workflow(self, workflow_id: str) -> CallToolResult:
         """Get specific workflow details"""
         try:
-            url = f"{Config.N8N_BASE_URL}/api/v1/workflows/{workflow_id}"
-            headers = {"X-N8N-API-KEY": Config.N8N_API_KEY} if Config.N8N_API_KEY else {}
-            
-            response = await self.http_client.get(url, headers=headers)
-            response.raise_for_status()
+            async def load_workflow() -> Dict[str, Any]:
+                url = f"{Config.N8N_BASE_URL}/api/v1/workflows/{workflow_id}"
+                headers = {"X-N8N-API-KEY": Config.N8N_API_KEY} if Config.N8N_API_KEY else {}
+                
+                response = await self.http_client.get(url, headers=headers)
+                response.raise_for_status()
+                return response.json()
             
-            workflow = response.json()
+            workflow = await self.cache.get_or_load(f"n8n:workflow:{workflow_id}", load_workflow, Config.CACHE_TTL_WORKFLOWS)
             return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(workflow, indent=2))]
+                content=[TextContent(type="text", text=await self.offload.dumps(workflow, indent=2))]
             )
         except Exception as e:
             return CallToolResult(
@@ -453,7 +2745,8 @@ class N8NMCPServer:
             execution = response.json()
             
             if wait_for_completion and execution.get("id"):
-                # Poll for completion
+                # Poll for completion without holding an admission slot
+                self.tool_admission.release_slot()
                 execution_id = execution["id"]
                 for _ in range(30):  # Wait up to 30 seconds
                     await asyncio.sleep(1)
@@ -466,11 +2759,12 @@ class N8NMCPServer:
                             break
             
             return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(execution, indent=2))]
+                content=[TextContent(type="text", text=await self.offload.dumps(execution, indent=2))]
             )
         except Exception as e:
             return CallToolResult(
-                content=[TextContent(type="text", text=f"Error executing workflow: {str(e)}")]
+                content=[TextContent(type="text", text=f"Error executing workflow: {str(e)}")],
+                isError=True
             )
     
     async def create_multimodal_workflow(self, name: str, description: str, workflow_type: str, components: List[str]) -> CallToolResult:
@@ -488,8 +2782,9 @@ class N8NMCPServer:
             response.raise_for_status()
             
             created_workflow = response.json()
+            await self.cache.invalidate("n8n:workflows")
             return CallToolResult(
-                content=[TextContent(type="text", text=f"Created multimodal workflow: {json.dumps(created_workflow, indent=2)}")]
+                content=[TextContent(type="text", text=f"Created multimodal workflow: {await self.offload.dumps(created_workflow, indent=2)}")]
             )
         except Exception as e:
             return CallToolResult(
@@ -505,20 +2800,144 @@ class N8NMCPServer:
                 "negative_prompt": params.get("negative_prompt", ""),
                 "width": params.get("width", 512),
                 "height": params.get("height", 512),
-                "steps": params.get("steps", 20)
+                "steps": params.get("steps", 20),
+                "sampler": params.get("sampler", "euler"),
+                "loras": list(params.get("loras", []))
             }
+            checkpoint = params.get("checkpoint") or None
+            if checkpoint:
+                workflow["checkpoint"] = checkpoint
+            
+            # Only seeded graphs are deterministic, so only they are cacheable
+            cache_key = None
+            if params.get("seed") is not None:
+                workflow["seed"] = params["seed"]
+                cache_key = GenerationCache.make_key(workflow)
+                cached = await self._lookup_generation(cache_key)
+                if cached is not None:
+                    return cached
             
-            url = f"{Config.COMFYUI_BASE_URL}/api/prompt"
-            response = await self.http_client.post(url, json={"prompt": workflow})
+            instance = self.comfyui_pool.route(checkpoint)
+            stream = self.comfyui_pool.event_streams[instance.url]
+            url = f"{instance.url}/api/prompt"
+            # Submitting with the stream's client id makes ComfyUI address progress and preview frames to it
+            response = await self.http_client.post(url, json={"prompt": workflow, "client_id": stream.client_id})
             response.raise_for_status()
             
             result = response.json()
+            result["comfyui_instance"] = instance.url
+            if cache_key and result.get("prompt_id"):
+                self.generation_cache.record_pending(cache_key, instance.url, result["prompt_id"])
+            if params.get("wait_for_completion") and result.get("prompt_id"):
+                # Submitted; waiting for the render must not hold an admission slot
+                self.tool_admission.release_slot()
+                state = await stream.wait_for_completion(result["prompt_id"], params.get("timeout", 300))
+                result.update(state.to_dict())
+                result["files"] = [
+                    os.path.join(Config.COMFYUI_OUTPUT_DIR, output.get("subfolder", ""), output["filename"])
+                    for output in state.outputs
+                    if output.get("type", "output") == "output"
+                ]
+                await self._dedup_new_outputs(result["files"])
+                return CallToolResult(
+                    content=[TextContent(type="text", text=f"Image generation {state.status}: {json.dumps(result, indent=2)}")]
+                )
             return CallToolResult(
                 content=[TextContent(type="text", text=f"Image generation started: {json.dumps(result, indent=2)}")]
             )
         except Exception as e:
             return CallToolResult(
-                content=[TextContent(type="text", text=f"Error generating image: {str(e)}")]
+                content=[TextContent(type="text", text=f"Error generating image: {str(e)}")],
+                isError=True
+            )
+    
+    async def _lookup_generation(self, cache_key: str) -> Optional[CallToolResult]:
+        """Serve a seeded generation from the cache, or attach to the identical prompt in flight"""
+        entry = self.generation_cache.lookup(cache_key)
+        if entry is None:
+            return None
+        
+        if not entry["files"]:
+            try:
+                outputs = await self._get_comfyui_outputs(entry["comfyui_instance"], entry["prompt_id"])
+            except Exception as e:
+                # The owning instance is down or erroring; rendering again beats waiting on it
+                logger.warning(f"Generation cache entry {cache_key[:12]} unresolvable on {entry['comfyui_instance']}: {str(e)}")
+                self.generation_cache.evict(cache_key)
+                return None
+            if outputs is None:
+                result = {"prompt_id": entry["prompt_id"], "comfyui_instance": entry["comfyui_instance"]}
+                return CallToolResult(
+                    content=[TextContent(type="text", text=f"Identical image generation already in progress: {json.dumps(result, indent=2)}")]
+                )
+            if not outputs:
+                # The earlier run failed, produced nothing or was lost; fall through and render again
+                self.generation_cache.evict(cache_key)
+                return None
+            entry = self.generation_cache.record_outputs(cache_key, outputs)
+            await self._dedup_new_outputs(entry["files"])
+        
+        result = {
+            "prompt_id": entry["prompt_id"],
+            "comfyui_instance": entry["comfyui_instance"],
+            "files": entry["files"],
+            "cached": True
+        }
+        return CallToolResult(
+            content=[TextContent(type="text", text=f"Image served from generation cache: {json.dumps(result, indent=2)}")]
+        )
+    
+    async def _dedup_new_outputs(self, paths: List[str]):
+        """Hardlink just-written outputs to identical earlier ones when dedup-on-write is enabled"""
+        if not Config.DEDUP_ON_WRITE or not paths:
+            return
+        try:
+            reclaimed = await self.offload.run_in_thread(self.deduplicator.dedup_new, paths)
+            if reclaimed:
+                logger.info(f"Deduplicated new outputs, reclaimed {reclaimed} bytes")
+        except Exception as e:
+            logger.warning(f"Dedup of new outputs failed: {str(e)}")
+    
+    async def _get_comfyui_outputs(self, instance_url: str, prompt_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Saved images for a prompt from ComfyUI history; None while it is still queued or running,
+        empty when it failed or the instance has no record of it"""
+        stream = self.comfyui_pool.event_streams.get(instance_url)
+        state = stream.prompts.get(prompt_id) if stream else None
+        if state is not None and state.finished:
+            return [image for image in state.outputs if image.get("type", "output") == "output"]
+        # Read the queue before the history so a prompt finishing in between is still found
+        queue_response = await self.http_client.get(f"{instance_url}/queue", timeout=5)
+        queue_response.raise_for_status()
+        queue = queue_response.json()
+        queued = any(
+            item[1] == prompt_id
+            for item in queue.get("queue_running", []) + queue.get("queue_pending", [])
+        )
+        response = await self.http_client.get(f"{instance_url}/history/{prompt_id}", timeout=5)
+        response.raise_for_status()
+        history = response.json().get(prompt_id)
+        if not history:
+            # Neither queued nor in history: ComfyUI restarted or dropped the prompt
+            return None if queued else []
+        if not history.get("status", {}).get("completed", True):
+            return [] if history["status"].get("status_str") == "error" else None
+        return [
+            image
+            for node_output in history.get("outputs", {}).values()
+            for image in node_output.get("images", [])
+            if image.get("type", "output") == "output"
+        ]
+    
+    async def set_comfyui_drain(self, instance_url: str, drain: bool = True) -> CallToolResult:
+        """Toggle drain mode on a ComfyUI pool instance"""
+        try:
+            instance = self.comfyui_pool.set_draining(instance_url, drain)
+            return CallToolResult(
+                content=[TextContent(type="text", text=json.dumps(instance.to_dict(), indent=2))]
+            )
+        except Exception as e:
+            return CallToolResult(
+                content=[TextContent(type="text", text=f"Error setting drain mode: {str(e)}")]
             )
     
     async def create_video(self, params: Dict[str, Any]) -> CallToolResult:
@@ -532,21 +2951,86 @@ class N8NMCPServer:
                 "transition": params.get("transition", "fade")
             }
             
-            url = f"{Config.FFCREATOR_BASE_URL}/api/create"
-            response = await self.http_client.post(url, json=video_config)
-            response.raise_for_status()
+            async with self.ffcreator_replicas.request() as replica:
+                url = f"{replica.url}/api/create"
+                response = await self.http_client.post(url, json=video_config)
+                response.raise_for_status()
             
             result = response.json()
+            job_id = result.get("jobId") or result.get("job_id") or result.get("id")
+            if not job_id:
+                return CallToolResult(
+                    content=[TextContent(type="text", text=f"Video creation started: {json.dumps(result, indent=2)}")]
+                )
+            
+            self.video_jobs.register(job_id, replica.url, video_config["duration"])
+            await self.cache.set(f"ffcreator:job:{job_id}", self.video_jobs.jobs[job_id], Config.CACHE_TTL_JOBS)
+            if not params.get("wait_for_completion", False):
+                self.video_jobs.track(job_id, self.http_client)
+                result["job_id"] = job_id
+                return CallToolResult(
+                    content=[TextContent(type="text", text=f"Video creation started: {json.dumps(result, indent=2)}")]
+                )
+            return await self.get_video_job(job_id, True, params.get("timeout", 600))
+        except Exception as e:
+            return CallToolResult(
+                content=[TextContent(type="text", text=f"Error creating video: {str(e)}")],
+                isError=True
+            )
+    
+    async def get_video_job(self, job_id: str, wait_for_completion: bool = False, timeout: float = 600) -> CallToolResult:
+        """Report FFCreator job progress, optionally waiting on the shared tracker"""
+        try:
+            if job_id not in self.video_jobs.jobs:
+                # A job submitted through another replica: its shared state names the owning FFCreator
+                hit, shared_job = await self.cache.get(f"ffcreator:job:{job_id}")
+                if hit and shared_job["status"] in FFCreatorJobTracker.TERMINAL_STATES:
+                    return CallToolResult(
+                        content=[TextContent(type="text", text=json.dumps(shared_job, indent=2))]
+                    )
+                instance = shared_job["ffcreator_instance"] if hit else await self._locate_video_job(job_id)
+                self.video_jobs.register(job_id, instance, shared_job.get("duration") if hit else None)
+            
+            if wait_for_completion:
+                # Waiting only polls FFCreator, so it must not hold an admission slot
+                self.tool_admission.release_slot()
+                job = await self.video_jobs.wait(job_id, self.http_client, timeout)
+            else:
+                self.video_jobs.track(job_id, self.http_client)
+                job = self.video_jobs.jobs[job_id]
+            await self.cache.set(f"ffcreator:job:{job_id}", job, Config.CACHE_TTL_JOBS)
+            
             return CallToolResult(
-                content=[TextContent(type="text", text=f"Video creation started: {json.dumps(result, indent=2)}")]
+                content=[TextContent(type="text", text=json.dumps(job, indent=2))]
             )
         except Exception as e:
             return CallToolResult(
-                content=[TextContent(type="text", text=f"Error creating video: {str(e)}")]
+                content=[TextContent(type="text", text=f"Error getting video job: {str(e)}")],
+                isError=True
             )
     
+    async def _locate_video_job(self, job_id: str) -> str:
+        """Find the FFCreator replica that owns a job this server did not submit"""
+        for replica in self.ffcreator_replicas.replicas:
+            try:
+                response = await self.http_client.get(f"{replica.url}/api/jobs/{job_id}", timeout=5)
+            except httpx.TransportError:
+                continue
+            if response.status_code == 200:
+                return replica.url
+        raise ValueError(f"Unknown FFCreator job: {job_id}")
+    
     async def synthesize_speech(self, params: Dict[str, Any]) -> CallToolResult:
         """Synthesize speech using Kokoro TTS"""
+        if params.get("long_text") or params.get("word_timings"):
+            # Timings need the raw PCM, which only the chunked path keeps, and that path writes WAV
+            output_format = params.get("output_format", "wav")
+            if output_format != "wav":
+                option = "word_timings" if params.get("word_timings") else "long_text"
+                return CallToolResult(
+                    content=[TextContent(type="text", text=f"Error synthesizing speech: {option} only produces WAV output, not {output_format}")]
+                )
+            return await self.synthesize_long_speech(params)
         try:
             tts_config = {
                 "text": params["text"],
@@ -555,9 +3039,10 @@ class N8NMCPServer:
                 "output_format": params.get("output_format", "wav")
             }
             
-            url = f"{Config.KOKORO_BASE_URL}/v1/audio/speech"
-            response = await self.http_client.post(url, json=tts_config)
-            response.raise_for_status()
+            async with self.kokoro_replicas.request() as replica:
+                url = f"{replica.url}/v1/audio/speech"
+                response = await self.http_client.post(url, json=tts_config)
+                response.raise_for_status()
             
             result = response.json()
             return CallToolResult(
@@ -568,6 +3053,125 @@ class N8NMCPServer:
                 content=[TextContent(type="text", text=f"Error synthesizing speech: {str(e)}")]
             )
     
+    async def synthesize_long_speech(self, params: Dict[str, Any]) -> CallToolResult:
+        """Synthesize long narrations chunk by chunk and concatenate the PCM into one WAV"""
+        try:
+            chunks = self._split_narration(params["text"], Config.KOKORO_CHUNK_MAX_CHARS)
+            if not chunks:
+                raise ValueError("No text to synthesize")
+            semaphore = asyncio.Semaphore(Config.KOKORO_CHUNK_CONCURRENCY)
+            
+            async def synthesize_chunk(chunk: str) -> bytes:
+                tts_config = {
+                    "model": "kokoro",
+                    "input": chunk,
+                    "voice": params.get("voice", "default"),
+                    "speed": params.get("speed", 1.0),
+                    "response_format": "pcm"
+                }
+                async with semaphore:
+                    async with self.kokoro_replicas.request() as replica:
+                        response = await self.http_client.post(f"{replica.url}/v1/audio/speech", json=tts_config)
+                        response.raise_for_status()
+                return response.content
+            
+            started = time.monotonic()
+            pcm_chunks = align_pcm_chunks(await asyncio.gather(*(synthesize_chunk(chunk) for chunk in chunks)))
+            
+            # 16-bit mono PCM: plain concatenation, offsets come straight from sample counts
+            offsets = []
+            position = 0
+            for chunk, pcm in zip(chunks, pcm_chunks):
+                samples = len(pcm) // 2
+                offsets.append({
+                    "text": chunk,
+                    "start": round(position / Config.KOKORO_SAMPLE_RATE, 3),
+                    "end": round((position + samples) / Config.KOKORO_SAMPLE_RATE, 3)
+                })
+                position += samples
+            
+            digest = hashlib.sha256(params["text"].encode("utf-8")).hexdigest()[:12]
+            output_path = os.path.join(
+                Config.KOKORO_OUTPUT_DIR,
+                f"narration_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{digest}.wav"
+            )
+            os.makedirs(Config.KOKORO_OUTPUT_DIR, exist_ok=True)
+            await self.offload.run_in_thread(write_wav, output_path, pcm_chunks, Config.KOKORO_SAMPLE_RATE)
+            await self._dedup_new_outputs([output_path])
+            
+            result = {
+                "path": output_path,
+                "format": "wav",
+                "duration": round(position / Config.KOKORO_SAMPLE_RATE, 3),
+                "chunk_count": len(chunks),
+                "synthesis_seconds": round(time.monotonic() - started, 3),
+                "chunks": offsets
+            }
+            if params.get("word_timings"):
+                samples = np.frombuffer(b"".join(pcm_chunks), dtype="<i2")
+                timings = await self.offload.run_in_thread(
+                    extract_word_timings, samples, Config.KOKORO_SAMPLE_RATE, params["text"]
+                )
+                result["timings_path"] = await self.offload.run_in_thread(
+                    write_word_timings, output_path, params["text"], timings, result["duration"]
+                )
+            return CallToolResult(
+                content=[TextContent(type="text", text=f"Speech synthesis completed: {await self.offload.dumps(result, indent=2)}")]
+            )
+        except Exception as e:
+            return CallToolResult(
+                content=[TextContent(type="text", text=f"Error synthesizing speech: {str(e)}")]
+            )
+    
+    async def extract_word_timings(self, audio_path: str, text: str) -> CallToolResult:
+        """Write word-level timings for an existing WAV file"""
+        try:
+            samples, sample_rate = await self.offload.run_in_thread(read_wav_samples, audio_path)
+            duration = round(len(samples) / sample_rate, 3)
+            timings = await self.offload.run_in_thread(extract_word_timings, samples, sample_rate, text)
+            result = {
+                "audio_path": audio_path,
+                "duration": duration,
+                "word_count": len(timings),
+                "timings_path": await self.offload.run_in_thread(write_word_timings, audio_path, text, timings, duration)
+            }
+            return CallToolResult(
+                content=[TextContent(type="text", text=await self.offload.dumps(result, indent=2))]
+            )
+        except Exception as e:
+            return CallToolResult(
+                content=[TextContent(type="text", text=f"Error extracting word timings: {str(e)}")]
+            )
+    
+    @staticmethod
+    def _split_narration(text: str, max_chars: int) -> List[str]:
+        """Split text into chunks of whole sentences, never crossing a paragraph boundary"""
+        chunks = []
+        for paragraph in re.split(r"\n\s*\n", text):
+            sentences = [s.strip() for s in re.split(r"(?<=[.!?…])\s+", paragraph.strip()) if s.strip()]
+            current = ""
+            for sentence in sentences:
+                # A single overlong sentence is broken at clause, then word boundaries
+                while len(sentence) > max_chars:
+                    cut = max(sentence.rfind(", ", 0, max_chars), sentence.rfind("; ", 0, max_chars))
+                    if cut <= 0:
+                        cut = sentence.rfind(" ", 0, max_chars)
+                    if cut <= 0:
+                        # No boundary at all: cut mid-word so the head is exactly max_chars long
+                        cut = max_chars - 1
+                    head, sentence = sentence[:cut + 1].strip(), sentence[cut + 1:].strip()
+                    if current:
+                        chunks.append(current)
+                        current = ""
+                    chunks.append(head)
+                if current and len(current) + 1 + len(sentence) > max_chars:
+                    chunks.append(current)
+                    current = ""
+                current = f"{current} {sentence}" if current else sentence
+            if current:
+                chunks.append(current)
+        return chunks
+    
     async def get_service_status(self, service: str = "all") -> CallToolResult:
         """Get status of AI services"""
         try:
@@ -577,7 +3181,7 @@ class N8NMCPServer:
                 status = {service: status[service]}
             
             return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(status, indent=2))]
+                content=[TextContent(type="text", text=await self.offload.dumps(status, indent=2))]
             )
         except Exception as e:
             return CallToolResult(
@@ -590,6 +3194,8 @@ class N8NMCPServer:
             assets = await self._get_generated_assets()
             
             if asset_type != "all":
+                # Tool enum is plural ("images", "videos") while asset types are singular
+                asset_type = asset_type.rstrip("s")
                 assets = [a for a in assets if a.get("type") == asset_type]
             
             assets = assets[:limit]
@@ -600,75 +3206,131 @@ class N8NMCPServer:
             }
             
             return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(result, indent=2))]
+                content=[TextContent(type="text", text=await self.offload.dumps(result, indent=2))]
             )
         except Exception as e:
             return CallToolResult(
                 content=[TextContent(type="text", text=f"Error listing assets: {str(e)}")]
             )
     
+    async def deduplicate_assets(self, dry_run: bool = False) -> CallToolResult:
+        """Run a dedup pass over the output volumes"""
+        try:
+            report = await self.offload.run_in_thread(self.deduplicator.run, dry_run)
+            report["reclaimed_mb"] = round(report["reclaimed_bytes"] / (1024 * 1024), 2)
+            
+            return CallToolResult(
+                content=[TextContent(type="text", text=json.dumps(report, indent=2))]
+            )
+        except Exception as e:
+            return CallToolResult(
+                content=[TextContent(type="text", text=f"Error deduplicating assets: {str(e)}")]
+            )
+    
     # Helper methods
     async def _get_n8n_workflows(self) -> List[Dict[str, Any]]:
         """Get N8N workflows"""
         try:
-            url = f"{Config.N8N_BASE_URL}/api/v1/workflows"
-            headers = {"X-N8N-API-KEY": Config.N8N_API_KEY} if Config.N8N_API_KEY else {}
-            
-            response = await self.http_client.get(url, headers=headers)
-            response.raise_for_status()
-            
-            return response.json().get("data", [])
+            return await self.cache.get_or_load("n8n:workflows", self._fetch_n8n_workflows, Config.CACHE_TTL_WORKFLOWS)
         except Exception as e:
             logger.error(f"Error getting N8N workflows: {str(e)}")
             return []
     
+    async def _fetch_n8n_workflows(self) -> List[Dict[str, Any]]:
+        url = f"{Config.N8N_BASE_URL}/api/v1/workflows"
+        headers = {"X-N8N-API-KEY": Config.N8N_API_KEY} if Config.N8N_API_KEY else {}
+        
+        response = await self.http_client.get(url, headers=headers)
+        response.raise_for_status()
+        
+        return response.json().get("data", [])
+    
     async def _get_all_service_status(self) -> Dict[str, Any]:
-        """Get status of all services"""
-        status = {}
+        """Get status of all services; raw probe results are shared between replicas for a few seconds"""
+        probes = await self.cache.get_or_load(
+            "services:status", self._probe_all_services, Config.CACHE_TTL_SERVICE_STATUS
+        )
+        # Balancer state, drain flags and latency history are per process, so they are always
+        # overlaid from this process rather than taken from another replica's snapshot
+        status = {"n8n": {"status": probes["n8n"], "latency": self.n8n_probes.stats()}}
         
-        # Check N8N
-        try:
-            response = await self.http_client.get(f"{Config.N8N_BASE_URL}/healthz", timeout=5)
-            status["n8n"] = {"status": "healthy" if response.status_code == 200 else "unhealthy"}
-        except:
-            status["n8n"] = {"status": "unreachable"}
+        # ComfyUI pool, healthy while at least one instance is routable
+        instances = self.comfyui_pool.status()
+        routable = [i for i in instances if i["status"] == "healthy"]
+        status["comfyui"] = {
+            "status": "healthy" if routable else "unreachable",
+            "latency": ProbeHistory.summarize([instance.probes for instance in self.comfyui_pool.instances]),
+            "instances": instances
+        }
         
-        # Check ComfyUI
+        status["ffcreator"] = self._replica_set_status(self.ffcreator_replicas, probes["ffcreator"])
+        status["kokoro"] = self._replica_set_status(self.kokoro_replicas, probes["kokoro"])
+        status["mcp_server"] = {
+            "status": "healthy",
+            "event_loop_lag": self.loop_lag.stats(),
+            "offload": self.offload.stats(),
+            "cache": self.cache.stats(),
+            "dedup": self.deduplicator.stats(),
+            "tool_queue": self.tool_admission.stats()
+        }
+        return status
+    
+    async def _probe_all_services(self) -> Dict[str, Any]:
+        """Probe every backend service, returning only the probe outcomes"""
+        started = time.monotonic()
         try:
-            response = await self.http_client.get(f"{Config.COMFYUI_BASE_URL}/", timeout=5)
-            status["comfyui"] = {"status": "healthy" if response.status_code == 200 else "unhealthy"}
+            response = await self.http_client.get(f"{Config.N8N_BASE_URL}/healthz", timeout=5)
+            n8n = "healthy" if response.status_code == 200 else "unhealthy"
         except:
-            status["comfyui"] = {"status": "unreachable"}
+            n8n = "unreachable"
+        self.n8n_probes.record((time.monotonic() - started) * 1000, n8n == "healthy")
         
-        # Check FFCreator
-        try:
-            response = await self.http_client.get(f"{Config.FFCREATOR_BASE_URL}/", timeout=5)
-            status["ffcreator"] = {"status": "healthy" if response.status_code == 200 else "unhealthy"}
-        except:
-            status["ffcreator"] = {"status": "unreachable"}
+        # Every process samples its own ComfyUI pool in the background; this just refreshes it now
+        await self.comfyui_pool.sample()
         
-        # Check Kokoro
-        try:
-            response = await self.http_client.get(f"{Config.KOKORO_BASE_URL}/", timeout=5)
-            status["kokoro"] = {"status": "healthy" if response.status_code == 200 else "unhealthy"}
-        except:
-            status["kokoro"] = {"status": "unreachable"}
+        return {
+            "n8n": n8n,
+            "ffcreator": await self._probe_replica_set(self.ffcreator_replicas),
+            "kokoro": await self._probe_replica_set(self.kokoro_replicas)
+        }
+    
+    async def _probe_replica_set(self, replica_set: ReplicaSet) -> Dict[str, str]:
+        """Probe every replica, keyed by URL"""
+        async def probe(replica: Replica) -> str:
+            started = time.monotonic()
+            try:
+                response = await self.http_client.get(f"{replica.url}/", timeout=5)
+                result = "healthy" if response.status_code == 200 else "unhealthy"
+            except:
+                result = "unreachable"
+            replica.probes.record((time.monotonic() - started) * 1000, result == "healthy")
+            return result
         
-        return status
+        probes = await asyncio.gather(*(probe(replica) for replica in replica_set.replicas))
+        return {replica.url: result for replica, result in zip(replica_set.replicas, probes)}
     
-    async def _get_generated_assets(self) -> List[Dict[str, Any]]:
-        """Get list of generated assets"""
-        # This would scan the shared volumes for generated content
-        # For now, return a placeholder
-        return [
-            {
-                "type": "image",
-                "name": "generated_image_001.png",
-                "path": "/shared-data/comfyui/output/generated_image_001.png",
-                "created": datetime.now().isoformat(),
-                "size": "1024x1024"
-            }
+    def _replica_set_status(self, replica_set: ReplicaSet, probes: Dict[str, str]) -> Dict[str, Any]:
+        """Merge shared probe outcomes with this process's balancer stats"""
+        replicas = [
+            {"status": probes.get(stats["url"], "unknown"), **stats}
+            for stats in replica_set.status()
         ]
+        outcomes = [replica["status"] for replica in replicas]
+        if "healthy" in outcomes:
+            overall = "healthy"
+        elif "unhealthy" in outcomes:
+            overall = "unhealthy"
+        else:
+            overall = "unreachable"
+        return {
+            "status": overall,
+            "latency": ProbeHistory.summarize([replica.probes for replica in replica_set.replicas]),
+            "replicas": replicas
+        }
+    
+    async def _get_generated_assets(self) -> List[Dict[str, Any]]:
+        """Get list of generated assets with their media metadata"""
+        return await self.asset_index.assets()
     
     def _generate_multimodal_workflow_definition(self, name: str, description: str, workflow_type: str, components: List[str]) -> Dict[str, Any]:
         """Generate N8N workflow definition for multimodal workflow"""
@@ -763,7 +3425,7 @@ async def main():
                 InitializationOptions(
                     server_name=Config.SERVER_NAME,
                     server_version=Config.SERVER_VERSION,
-                    capabilities=mcp_server.server.get_capabilities(),
+                    capabilities=mcp_server.get_capabilities(),
                 ),
             )
 
@@ -2,12 +2,14 @@ from .prompt_combinator import PromptCombinator
 from .prompt_combinator import PromptCombinatorMerger
 from .prompt_combinator import PromptCombinatorExportGallery
 from .prompt_combinator import PromptCombinatorRandomPrompt
+from .prompt_combinator import PromptCombinatorSampler
 
 NODE_CLASS_MAPPINGS = {
     "PromptCombinator": PromptCombinator,
     "PromptCombinatorMerger": PromptCombinatorMerger,
     "PromptCombinatorExportGallery": PromptCombinatorExportGallery,
     "PromptCombinatorRandomPrompt": PromptCombinatorRandomPrompt,
+    "PromptCombinatorSampler": PromptCombinatorSampler,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
@@ -15,6 +17,7 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "PromptCombinatorMerger": "🔢 Prompt Combinator Merger",
     "PromptCombinatorExportGallery": "🔢 Prompt Combinator Export Gallery",
     "PromptCombinatorRandomPrompt": "🔢 Pick Random Prompt from Prompt Combinator",
+    "PromptCombinatorSampler": "🔢 Prompt Combinator Random Sampler",
 }
 
 __all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS']
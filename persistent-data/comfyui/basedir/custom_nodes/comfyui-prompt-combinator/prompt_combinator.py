@@ -1,7 +1,13 @@
-from itertools import product
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import io
+import hashlib
+import json
 import re
 import random
 import os
+import sys
 import base64
 
 import folder_paths
@@ -10,9 +16,195 @@ from PIL import Image
 from PIL.PngImagePlugin import PngInfo
 
 import numpy as np
+import torch
 
 id_pattern = re.compile(r'^[a-zA-Z0-9 ]+$')
 
+join_separators = {"comma and space": ', ', "space": ' ', "enter": '\n'}
+
+def combination_count(radices):
+    """Number of combinations in the product of lists with the given lengths."""
+    count = 1
+    for radix in radices:
+        count *= radix
+    return count
+
+def decode_combination(index, radices):
+    """
+    Decode a combination index into one position per list, treating the index as a mixed-radix
+    number whose last digit varies fastest. This matches the order of itertools.product, so
+    any combination can be built without enumerating the ones before it.
+    """
+    positions = [0] * len(radices)
+    for i in range(len(radices) - 1, -1, -1):
+        index, positions[i] = divmod(index, radices[i])
+    return positions
+
+def shard_indices(total, shard_index, shard_count, shard_mode):
+    """
+    Combination indices owned by one shard, in ascending product order. Strided shards take every
+    shard_count-th index; contiguous shards take one block of nearly equal size. Either way the
+    shards are disjoint and together cover every index exactly once.
+    """
+    assert shard_count >= 1, "shard_count must be at least 1"
+    assert 0 <= shard_index < shard_count, f"shard_index must be between 0 and {shard_count - 1}"
+    if shard_mode == "strided":
+        return range(shard_index, total, shard_count)
+    return range(total * shard_index // shard_count, total * (shard_index + 1) // shard_count)
+
+def page_indices(index_ranges, offset, limit):
+    """Yield indices [offset, offset + limit) of a sequence given as ascending ranges; limit 0 means all."""
+    remaining = limit
+    for index_range in index_ranges:
+        if offset >= len(index_range):
+            offset -= len(index_range)
+            continue
+        index_range = index_range[offset:]
+        offset = 0
+        if limit:
+            index_range = index_range[:remaining]
+            remaining -= len(index_range)
+        yield from index_range
+        if limit and remaining == 0:
+            return
+
+class CombinationRules:
+    """
+    Exclusion and inclusion rules on combination ids, one per line:
+
+        exclude: night+beach      drop every combination that uses both ids
+        include: cat+hat          when include rules exist, keep only combinations matching one of them
+
+    Rules are applied while walking the combination tree, so a prefix that already violates an
+    exclusion, or can no longer satisfy any inclusion, is pruned without generating its subtree.
+    Subtrees that no rule can affect any more are kept as a whole.
+    """
+    def __init__(self, excludes, includes):
+        self.excludes = excludes
+        self.includes = includes
+
+    @classmethod
+    def parse(cls, text, comment_prefix):
+        excludes = []
+        includes = []
+        for line in text.strip().split('\n'):
+            line = line.strip()
+            if line == '' or line.startswith(comment_prefix):
+                continue
+            kind, separator, ids = line.partition(':')
+            kind = kind.strip().lower()
+            assert separator and kind in ("exclude", "include"), f'Rules must look like "exclude: id1+id2" or "include: id1+id2". Offending rule is {line}'
+            rule = frozenset(id_part.strip() for id_part in ids.split('+') if id_part.strip())
+            assert rule, f'Rule without ids: {line}'
+            (excludes if kind == "exclude" else includes).append(rule)
+        return cls(excludes, includes)
+
+    def __bool__(self):
+        return bool(self.excludes or self.includes)
+
+    def prepare(self, list_of_ids):
+        self.list_of_ids = list_of_ids
+        self.radices = [len(ids) for ids in list_of_ids]
+        self.rule_ids = frozenset().union(*self.excludes, *self.includes)
+        depth_count = len(list_of_ids)
+        # Subtree sizes and the rule ids still reachable below each depth
+        self.sizes = [1] * (depth_count + 1)
+        self.available = [frozenset()] * (depth_count + 1)
+        for depth in range(depth_count - 1, -1, -1):
+            self.sizes[depth] = self.sizes[depth + 1] * self.radices[depth]
+            self.available[depth] = self.available[depth + 1] | (self.rule_ids & frozenset(list_of_ids[depth]))
+        self._counts = {}
+        self._residue_counts = {}
+
+    def state(self, depth, chosen):
+        """'pruned', 'kept' or 'open' for a prefix, given the rule ids chosen so far."""
+        if any(rule <= chosen for rule in self.excludes):
+            return "pruned"
+        reachable = chosen | self.available[depth]
+        if self.includes and not any(rule <= chosen for rule in self.includes):
+            if not any(rule <= reachable for rule in self.includes):
+                return "pruned"
+            return "open"
+        if any(rule <= reachable for rule in self.excludes):
+            return "open"
+        return "kept"
+
+    def count(self, depth=0, chosen=frozenset()):
+        """Number of kept combinations below a prefix; memoized on the rule ids it contains."""
+        key = (depth, chosen)
+        if key not in self._counts:
+            state = self.state(depth, chosen)
+            if state == "pruned":
+                kept = 0
+            elif state == "kept" or depth == len(self.radices):
+                kept = self.sizes[depth]
+            else:
+                kept = sum(self.count(depth + 1, chosen | ({id_part} & self.rule_ids)) for id_part in self.list_of_ids[depth])
+            self._counts[key] = kept
+        return self._counts[key]
+
+    def residue_counts(self, modulus, depth=0, chosen=frozenset()):
+        """
+        Kept combinations below a prefix, split by their offset within the subtree modulo modulus.
+        Like count, this is memoized on the rule ids the prefix contains.
+        """
+        key = (modulus, depth, chosen)
+        if key not in self._residue_counts:
+            state = self.state(depth, chosen)
+            if state == "pruned":
+                counts = [0] * modulus
+            elif state == "kept" or depth == len(self.radices):
+                base, extra = divmod(self.sizes[depth], modulus)
+                counts = [base + (residue < extra) for residue in range(modulus)]
+            else:
+                counts = [0] * modulus
+                child_size = self.sizes[depth + 1]
+                for position, id_part in enumerate(self.list_of_ids[depth]):
+                    child = self.residue_counts(modulus, depth + 1, chosen | ({id_part} & self.rule_ids))
+                    shift = position * child_size % modulus
+                    for residue, child_count in enumerate(child):
+                        counts[(residue + shift) % modulus] += child_count
+            self._residue_counts[key] = counts
+        return self._residue_counts[key]
+
+    def kept_ranges(self, start, stop, skip=0, stride=1, residue=0):
+        """
+        Yield ascending ranges of kept combination indices within [start, stop). With a stride
+        above 1 only indices congruent to residue modulo stride are kept, and the ranges are
+        strided. The first skip matching indices are passed over using subtree counts instead of
+        being generated, and subtrees without any match are never entered.
+        """
+        skip = [skip]
+
+        def matching(depth, chosen, low):
+            if stride == 1:
+                return self.count(depth, chosen)
+            return self.residue_counts(stride, depth, chosen)[(residue - low) % stride]
+
+        def walk(depth, prefix, chosen):
+            size = self.sizes[depth]
+            low, high = prefix * size, (prefix + 1) * size
+            if high <= start or low >= stop:
+                return
+            state = self.state(depth, chosen)
+            if state == "pruned":
+                return
+            if start <= low and high <= stop and skip[0] >= matching(depth, chosen, low):
+                skip[0] -= matching(depth, chosen, low)
+                return
+            if state == "kept" or depth == len(self.radices):
+                kept = range(max(low, start), min(high, stop))
+                if stride > 1:
+                    kept = kept[(residue - kept.start) % stride::stride]
+                passed = min(skip[0], len(kept))
+                skip[0] -= passed
+                yield kept[passed:]
+                return
+            for position, id_part in enumerate(self.list_of_ids[depth]):
+                yield from walk(depth + 1, prefix * self.radices[depth] + position, chosen | ({id_part} & self.rule_ids))
+
+        yield from walk(0, 0, frozenset())
+
 class PromptCombinator:
     """
     ComfyUI-Prompt-Combinator
@@ -37,18 +229,50 @@ class PromptCombinator:
                 "input_list_6": ("STRING", {"default": '', "multiline": True}),
                 "input_list_7": ("STRING", {"default": '', "multiline": True}),
                 "input_list_8": ("STRING", {"default": '', "multiline": True}),
+                "offset": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
+                "limit": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
+                "count_only": ("BOOLEAN", {"default": False}),
+                "shard_index": ("INT", {"default": 0, "min": 0, "max": 0xffff}),
+                "shard_count": ("INT", {"default": 1, "min": 1, "max": 0xffff}),
+                "shard_mode": (["strided", "contiguous"], {"default": "strided"}),
+                "rules": ("STRING", {"default": '', "multiline": True}),
             }
         }
 
-    RETURN_TYPES = ("STRING", "PROMPTCOMBINATORIDS", "STRING")
-    RETURN_NAMES = ("prompts", "combination_ids", "filenames")
-    OUTPUT_IS_LIST = (True, True, True)
+    RETURN_TYPES = ("STRING", "PROMPTCOMBINATORIDS", "STRING", "INT", "INT", "INT")
+    RETURN_NAMES = ("prompts", "combination_ids", "filenames", "total_combinations", "kept_combinations", "pruned_combinations")
+    OUTPUT_IS_LIST = (True, True, True, False, False, False)
 
     FUNCTION = "execute"
 
     CATEGORY = "prompt_combinator"
 
+    # Parsed input lists keyed on (text hash, id_separator, comment_prefix), least recently used first
+    parse_cache = OrderedDict()
+    parse_cache_size = 256
+
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        """Hash of every input, so ComfyUI only re-runs the node when an input actually changed."""
+        digest = hashlib.sha256()
+        for name in sorted(kwargs):
+            digest.update(f'{name}\0{kwargs[name]}\0'.encode('utf-8'))
+        return digest.hexdigest()
+
     def parse_input(self, input_list, id_separator, comment_prefix):
+        key = (hashlib.sha256(input_list.encode('utf-8')).hexdigest(), id_separator, comment_prefix)
+        cached = self.parse_cache.get(key)
+        if cached is None:
+            cached = self.parse_input_uncached(input_list, id_separator, comment_prefix)
+            self.parse_cache[key] = cached
+            if len(self.parse_cache) > self.parse_cache_size:
+                self.parse_cache.popitem(last=False)
+        else:
+            self.parse_cache.move_to_end(key)
+        # Callers fill in missing ids, so never hand out the cached lists themselves
+        return list(cached[0]), list(cached[1])
+
+    def parse_input_uncached(self, input_list, id_separator, comment_prefix):
         entries = input_list.strip().split('\n') if input_list.strip() else ['']
         ids = []
         descriptions = []
@@ -72,9 +296,9 @@ class PromptCombinator:
         if not descriptions:
             descriptions.append('')
 
-        return ids, descriptions
+        return tuple(ids), tuple(descriptions)
 
-    def combine_descriptions_and_ids(self, *inputs, id_separator, comment_prefix, join_prompt_using):
+    def parse_inputs(self, *inputs, id_separator, comment_prefix):
         list_of_ids = []
         list_of_descriptions = []
         no_id_counters = [1] * len(inputs)
@@ -88,33 +312,155 @@ class PromptCombinator:
             list_of_ids.append(ids)
             list_of_descriptions.append(descriptions)
 
-        all_description_combinations = list(product(*list_of_descriptions))
-        all_id_combinations = list(product(*list_of_ids))
+        return list_of_ids, list_of_descriptions
+
+    def build_combination(self, positions, list_of_ids, list_of_descriptions, use):
+        descriptions = [list_of_descriptions[i][position] for i, position in enumerate(positions)]
+        ids = [list_of_ids[i][position] for i, position in enumerate(positions)]
+        return use.join(filter(None, descriptions)).strip(), ids
+
+    def combine_descriptions_and_ids(self, *inputs, id_separator, comment_prefix, join_prompt_using, offset=0, limit=0, shard_index=0, shard_count=1, shard_mode="strided", rules=None):
+        """
+        Returns the prompts and ids of kept combinations [offset, offset + limit) of the given shard,
+        in product order, plus the total and kept number of combinations. A limit of 0 means all
+        remaining combinations. Only the requested page is built, so memory does not depend on the
+        size of the product. Shards partition combination indices, so rules never move a
+        combination from one shard to another.
+        """
+        list_of_ids, list_of_descriptions = self.parse_inputs(*inputs, id_separator=id_separator, comment_prefix=comment_prefix)
+        radices = [len(descriptions) for descriptions in list_of_descriptions]
+        total = combination_count(radices)
+
+        indices = shard_indices(total, shard_index, shard_count, shard_mode)
+        if rules:
+            rules.prepare(list_of_ids)
+            kept = rules.count()
+            # Skip whole subtrees before the page by their kept counts
+            if shard_mode == "strided" and shard_count > 1:
+                index_ranges = rules.kept_ranges(0, total, skip=offset, stride=shard_count, residue=shard_index)
+            else:
+                index_ranges = rules.kept_ranges(indices.start, indices.stop, skip=offset)
+            offset = 0
+        else:
+            kept = total
+            index_ranges = [indices]
+        use = join_separators[join_prompt_using]
+
+        outputs = []
+        ids_lists = []
+        for index in page_indices(index_ranges, offset, limit):
+            prompt, ids = self.build_combination(decode_combination(index, radices), list_of_ids, list_of_descriptions, use)
+            outputs.append(prompt)
+            ids_lists.append(ids)
+
+        return outputs, ids_lists, total, kept
+
+    def execute(self, id_separator, comment_prefix, join_prompt_using, input_list_1, input_list_2="", input_list_3="", input_list_4="", input_list_5="", input_list_6="", input_list_7="", input_list_8="", offset=0, limit=0, count_only=False, shard_index=0, shard_count=1, shard_mode="strided", rules=""):
+        inputs = (input_list_1, input_list_2, input_list_3, input_list_4, input_list_5, input_list_6, input_list_7, input_list_8)
+        rules = CombinationRules.parse(rules, comment_prefix)
+        if count_only:
+            list_of_ids, _ = self.parse_inputs(*inputs, id_separator=id_separator, comment_prefix=comment_prefix)
+            total = combination_count([len(ids) for ids in list_of_ids])
+            if rules:
+                rules.prepare(list_of_ids)
+                kept = rules.count()
+            else:
+                kept = total
+            return [], [], [], total, kept, total - kept
+
+        prompts, ids, total, kept = self.combine_descriptions_and_ids(
+            *inputs,
+            id_separator=id_separator, comment_prefix=comment_prefix, join_prompt_using=join_prompt_using,
+            offset=offset, limit=limit,
+            shard_index=shard_index, shard_count=shard_count, shard_mode=shard_mode,
+            rules=rules
+        )
+        if rules:
+            print(f"Prompt Combinator rules kept {kept} of {total} combinations, pruned {total - kept}")
 
-        if join_prompt_using == "comma and space":
-            use = ', '
-        elif join_prompt_using == "space":
-            use = ' '
-        else: #"enter"
-            use = '\n'
+        filenames = []
+        for id_list in ids:
+            filename_parts = [id_part for id_part in id_list]
+            filenames.append('-'.join(filename_parts))
 
-        outputs = [use.join(filter(None, comb)).strip() for comb in all_description_combinations]
-        ids_lists = [list(comb) for comb in all_id_combinations]
+        return prompts, ids, filenames, total, kept, total - kept
 
-        return outputs, ids_lists
 
-    def execute(self, id_separator, comment_prefix, join_prompt_using, input_list_1, input_list_2="", input_list_3="", input_list_4="", input_list_5="", input_list_6="", input_list_7="", input_list_8=""):
-        prompts, ids = self.combine_descriptions_and_ids(
+class PromptCombinatorSampler(PromptCombinator):
+    """
+    ComfyUI-Prompt-Combinator
+    https://github.com/lquesada/ComfyUI-Prompt-Combinator
+
+    Node that draws a reproducible random sample of combinations from several lists of strings,
+    without generating the full set of combinations.
+    """
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "id_separator": ("STRING", {"default": '@'}),
+                "comment_prefix": ("STRING", {"default": '#'}),
+                "join_prompt_using": (["comma and space", "space", "enter"], {"default": "comma and space"}),
+                "sample_size": ("INT", {"default": 10, "min": 1, "max": 0xffffffff}),
+                "with_replacement": ("BOOLEAN", {"default": False}),
+                "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
+                "input_list_1": ("STRING", {"default": '', "multiline": True}),
+            },
+            "optional": {
+                "input_list_2": ("STRING", {"default": '', "multiline": True}),
+                "input_list_3": ("STRING", {"default": '', "multiline": True}),
+                "input_list_4": ("STRING", {"default": '', "multiline": True}),
+                "input_list_5": ("STRING", {"default": '', "multiline": True}),
+                "input_list_6": ("STRING", {"default": '', "multiline": True}),
+                "input_list_7": ("STRING", {"default": '', "multiline": True}),
+                "input_list_8": ("STRING", {"default": '', "multiline": True}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "PROMPTCOMBINATORIDS", "STRING", "INT")
+    RETURN_NAMES = ("prompts", "combination_ids", "filenames", "total_combinations")
+    OUTPUT_IS_LIST = (True, True, True, False)
+
+    FUNCTION = "sample"
+
+    def sample_indices(self, total, sample_size, with_replacement, seed):
+        """
+        Draws combination indices with a generator seeded only by the seed input, so the same inputs
+        always produce the same sample. Without replacement the sample holds distinct combinations
+        and is capped at the number of combinations available.
+        """
+        rng = random.Random(seed)
+        if with_replacement:
+            return [rng.randrange(total) for _ in range(sample_size)]
+        sample_size = min(sample_size, total)
+        if total <= sys.maxsize:
+            return rng.sample(range(total), sample_size)
+        # random.sample cannot take a range longer than sys.maxsize; the sample is tiny next to
+        # such a space, so rejecting repeated draws terminates almost immediately
+        drawn = {}
+        while len(drawn) < sample_size:
+            drawn.setdefault(rng.randrange(total), None)
+        return list(drawn)
+
+    def sample(self, id_separator, comment_prefix, join_prompt_using, sample_size, with_replacement, seed, input_list_1, input_list_2="", input_list_3="", input_list_4="", input_list_5="", input_list_6="", input_list_7="", input_list_8=""):
+        list_of_ids, list_of_descriptions = self.parse_inputs(
             input_list_1, input_list_2, input_list_3, input_list_4, input_list_5, input_list_6, input_list_7, input_list_8,
-            id_separator=id_separator, comment_prefix=comment_prefix, join_prompt_using=join_prompt_using
+            id_separator=id_separator, comment_prefix=comment_prefix
         )
+        radices = [len(descriptions) for descriptions in list_of_descriptions]
+        total = combination_count(radices)
+        use = join_separators[join_prompt_using]
 
+        prompts = []
+        ids = []
         filenames = []
-        for id_list in ids:
-            filename_parts = [id_part for id_part in id_list]
-            filenames.append('-'.join(filename_parts))
+        for index in self.sample_indices(total, sample_size, with_replacement, seed):
+            prompt, id_list = self.build_combination(decode_combination(index, radices), list_of_ids, list_of_descriptions, use)
+            prompts.append(prompt)
+            ids.append(id_list)
+            filenames.append('-'.join(id_list))
 
-        return prompts, ids, filenames
+        return prompts, ids, filenames, total
 
 
 class PromptCombinatorMerger:
@@ -199,6 +545,13 @@ class PromptCombinatorExportGallery:
                 "prompts": ("STRING", {"default": '', "multiline": True, "forceInput": True}),
                 "combination_ids": ("PROMPTCOMBINATORIDS",),
             },
+            "optional": {
+                "encoding_preset": (["smallest", "balanced", "fastest"], {"default": "smallest"}),
+                "append_to_existing": ("BOOLEAN", {"default": False}),
+                "lazy_load_thumbnails": ("BOOLEAN", {"default": False}),
+                "thumbnail_size": ("INT", {"default": 256, "min": 32, "max": 1024}),
+                "page_size": ("INT", {"default": 200, "min": 10, "max": 10000}),
+            },
         }
     INPUT_IS_LIST = True
 
@@ -209,7 +562,138 @@ class PromptCombinatorExportGallery:
 
     CATEGORY = "prompt_combinator"
 
-    def export_gallery(self, filename_prefix, image_export_format, embed_all_images_in_html, images, prompts, combination_ids):
+    # WebP method and PNG compress_level per encoding preset
+    webp_methods = {"smallest": 6, "balanced": 4, "fastest": 0}
+    png_compress_levels = {"smallest": 9, "balanced": 4, "fastest": 1}
+
+    # Templates split into literal text and {!placeholder} parts, loaded once per template file
+    placeholder_pattern = re.compile(r'(\{![a-z0-9]+\})')
+    templates = {}
+
+    def encode_image(self, img, fp, image_export_format, encoding_preset):
+        if image_export_format == ".png lossless":
+            metadata = PngInfo()
+            img.save(fp, format="PNG", pnginfo=metadata, compress_level=self.png_compress_levels[encoding_preset])
+        else: # .webp
+            imgexif = img.getexif()
+            method = self.webp_methods[encoding_preset]
+            if image_export_format == ".webp lossy 80":
+                img.save(fp, format="WEBP", method=method, exif=imgexif, lossless=False, quality=80)
+            elif image_export_format == ".webp lossy 90":
+                img.save(fp, format="WEBP", method=method, exif=imgexif, lossless=False, quality=90)
+            else: # ".webp lossless"
+                img.save(fp, format="WEBP", method=method, exif=imgexif, lossless=True, quality=0)
+
+    @classmethod
+    def load_template(cls, template_file):
+        if template_file not in cls.templates:
+            with open(template_file, 'r') as file:
+                cls.templates[template_file] = cls.placeholder_pattern.split(file.read())
+        return cls.templates[template_file]
+
+    def to_uint8_batches(self, images, batch_size):
+        """
+        Yields (index, HxWxC uint8 array) for every image. Runs of up to batch_size images with the
+        same shape are concatenated on their device and copied to the host in one transfer, then
+        scaled, clipped and cast in place into a single uint8 buffer per batch.
+        """
+        i = 0
+        while i < len(images):
+            shape = images[i].shape
+            j = i + 1
+            while j < len(images) and j - i < batch_size and images[j].shape == shape:
+                j += 1
+            # torch.cat always copies, so the in-place math below never touches the caller's tensors
+            batch = torch.cat(images[i:j]).cpu().numpy()
+            if batch.dtype != np.float32:
+                batch = batch.astype(np.float32)
+            np.multiply(batch, 255., out=batch)
+            np.clip(batch, 0, 255, out=batch)
+            pixels = np.empty(batch.shape, dtype=np.uint8)
+            np.copyto(pixels, batch, casting='unsafe')
+            del batch
+            for k in range(j - i):
+                yield i + k, pixels[k]
+            i = j
+
+    def find_gallery_counter(self, final_dir, output_dir, filename_prefix, append):
+        """
+        Returns the gallery number to write: the first free one, or when appending the highest one
+        that has a manifest. Each directory is listed once instead of probing number by number.
+        """
+        prefix_dir, prefix_name = os.path.split(filename_prefix)
+        gallery_pattern = re.compile(re.escape(prefix_name) + r'(?:_(\d{5}))?(\.html|\.manifest\.json|_files)$')
+        taken = set()
+        manifests = set()
+        for directory in (os.path.join(final_dir, prefix_dir), os.path.join(output_dir, prefix_dir)):
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                match = gallery_pattern.match(name)
+                if match:
+                    counter = int(match.group(1) or 0)
+                    taken.add(counter)
+                    if match.group(2) == ".manifest.json" and directory == os.path.join(final_dir, prefix_dir):
+                        manifests.add(counter)
+        if append and manifests:
+            return max(manifests)
+        counter = 0
+        while counter in taken:
+            counter += 1
+        return counter
+
+    def load_manifest(self, manifest_file):
+        if not os.path.exists(manifest_file):
+            return None
+        with open(manifest_file, 'r') as file:
+            return json.load(file)
+
+    def save_manifest(self, manifest_file, manifest):
+        tmp_file = manifest_file + ".tmp"
+        with open(tmp_file, 'w') as file:
+            json.dump(manifest, file)
+        os.replace(tmp_file, manifest_file)
+
+    def write_pages(self, files_dir, manifest, page_size):
+        """
+        Writes the manifest as numbered page scripts for the lazy loaded gallery, and returns one
+        summary per page (record count and the ids used in each slot) so the page can skip pages
+        that cannot match the selected filters without loading them. Pages are JSON wrapped in a
+        function call, so browsers load them from file:// where fetch() is not allowed.
+        """
+        records = [
+            {"id": fileid, "filename": entry["filename"], "thumbnail": entry.get("thumbnail"), "prompt": entry["prompt"], "ids": entry["ids"]}
+            for fileid, entry in manifest["images"].items()
+        ]
+        pages = []
+        for number, start in enumerate(range(0, len(records), page_size)):
+            page = records[start:start + page_size]
+            slots = [[] for _ in range(8)]
+            for record in page:
+                for slot, id_part in enumerate(record["ids"]):
+                    if id_part not in slots[slot]:
+                        slots[slot].append(id_part)
+            pages.append({"count": len(page), "ids": slots})
+            with open(os.path.join(files_dir, f"page-{number:05d}.js"), 'w') as file:
+                file.write(f"galleryPage({number}, ")
+                json.dump(page, file)
+                file.write(");\n")
+        return pages
+
+    def ordered_map(self, executor, function, items, window):
+        """
+        Like executor.map(function, *zip(*items)), but with at most window tasks submitted ahead of
+        the consumer, so neither inputs nor finished results pile up in memory.
+        """
+        pending = deque()
+        for args in items:
+            pending.append(executor.submit(function, *args))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def export_gallery(self, filename_prefix, image_export_format, embed_all_images_in_html, images, prompts, combination_ids, encoding_preset=["smallest"], append_to_existing=[False], lazy_load_thumbnails=[False], thumbnail_size=[256], page_size=[200]):
         assert len(combination_ids) == len(prompts), "Amount of combination ids must be the same as amount of prompts"
         assert len(images) == len(prompts), "Amount of images must be the same as amount of prompts"
         for image in images:
@@ -226,6 +710,23 @@ class PromptCombinatorExportGallery:
         assert len(embed_all_images_in_html) == 1, "Only an embed_all_images_in_html value is allowed"
         embed_all_images_in_html = embed_all_images_in_html[0]
 
+        assert len(encoding_preset) == 1, "Only an encoding preset is allowed"
+        encoding_preset = encoding_preset[0]
+
+        assert len(append_to_existing) == 1, "Only an append_to_existing value is allowed"
+        append_to_existing = append_to_existing[0]
+        assert not (append_to_existing and embed_all_images_in_html), "Only galleries with separate image files can be appended to, disable embed_all_images_in_html"
+
+        assert len(lazy_load_thumbnails) == 1, "Only a lazy_load_thumbnails value is allowed"
+        lazy_load_thumbnails = lazy_load_thumbnails[0]
+        assert not (lazy_load_thumbnails and embed_all_images_in_html), "Lazy loaded galleries keep images in separate files, disable embed_all_images_in_html"
+
+        assert len(thumbnail_size) == 1, "Only a thumbnail size is allowed"
+        thumbnail_size = thumbnail_size[0]
+
+        assert len(page_size) == 1, "Only a page size is allowed"
+        page_size = page_size[0]
+
         # Prepare output directories vs. tmp
         self.output_dir = folder_paths.get_output_directory()
         if not embed_all_images_in_html:
@@ -236,58 +737,45 @@ class PromptCombinatorExportGallery:
             output_dir = folder_paths.get_temp_directory()
             final_dir = folder_paths.get_output_directory()
 
-        # Prepare list of ids for html
-        ids = [[] for _ in range(8)]
-        for combination in combination_ids:
-            for i, id_part in enumerate(combination):
-                if id_part not in ids[i]:
-                    ids[i].append(id_part)
-
-        # After processing all combinations, check each slot
-        for i in range(len(ids)):
-            if len(ids[i])==1 and ids[i][0] == '':
-                ids[i] = []
-
-        ids_text = []
-        for id_list in ids:
-            if id_list:
-                ids_text.append(f'{id_list}')
-            else:
-                ids_text.append('null')
-
-        # Loop until we find a unique filename and directory
-        counter = 0
-        while True:
-            if counter == 0:
-                output_file = os.path.join(final_dir, f"{filename_prefix}.html")
-                files_dir = os.path.join(output_dir, f"{filename_prefix}_files")
-                fileprefix = os.path.join(os.path.basename(f"{filename_prefix}_files"), "img-")
-                savefilenameprefix = os.path.join(f"{filename_prefix}_files", "img-")
-            else:
-                output_file = os.path.join(final_dir, f"{filename_prefix}_{counter:05d}.html")
-                files_dir = os.path.join(output_dir, f"{filename_prefix}_{counter:05d}_files")
-                fileprefix = os.path.join(os.path.basename(f"{filename_prefix}_{counter:05d}_files"), "img-")
-                savefilenameprefix = os.path.join(f"{filename_prefix}_{counter:05d}_files", "img-")
-        
-            if not os.path.exists(output_file) and not os.path.exists(files_dir):
-                break
-    
-            counter += 1
+        counter = self.find_gallery_counter(final_dir, output_dir, filename_prefix, append_to_existing)
+        if counter == 0:
+            gallery_name = filename_prefix
+        else:
+            gallery_name = f"{filename_prefix}_{counter:05d}"
+        output_file = os.path.join(final_dir, f"{gallery_name}.html")
+        manifest_file = os.path.join(final_dir, f"{gallery_name}.manifest.json")
+        files_dir = os.path.join(output_dir, f"{gallery_name}_files")
+        fileprefix = os.path.join(os.path.basename(f"{gallery_name}_files"), "img-")
+        savefilenameprefix = os.path.join(f"{gallery_name}_files", "img-")
 
         assert os.path.commonpath((final_dir, os.path.abspath(output_file))) == final_dir, "Saving outside the output folder is not allowed."
         assert os.path.commonpath((output_dir, os.path.abspath(files_dir))) == output_dir, "Saving outside the output folder is not allowed."
 
         os.makedirs(files_dir, exist_ok=True)
+        if lazy_load_thumbnails:
+            os.makedirs(os.path.join(files_dir, "thumbs"), exist_ok=True)
 
         if image_export_format == ".png lossless":
             filesuffix = ".png"
+            datatype = "data:image/png"
+            extension = "png"
         else: # .webp
             filesuffix = ".webp"
-    
+            datatype = "data:image/webp"
+            extension = "webp"
+
+        manifest = self.load_manifest(manifest_file) if append_to_existing else None
+        if manifest:
+            assert manifest["format"] == extension, f"The gallery being appended to uses .{manifest['format']} images, not .{extension}"
+        else:
+            manifest = {"format": extension, "width": images[0].shape[2], "height": images[0].shape[1], "images": {}}
+
         results = list()
         this_filenames = []
         save_filenames = []
         this_fileid = []
+        this_thumbnails = []
+        save_thumbnails = []
         for i, id_list in enumerate(combination_ids):
             filename_parts = []
             for id_part in id_list:
@@ -295,50 +783,70 @@ class PromptCombinatorExportGallery:
             file = '-'.join(filename_parts)
             this_filename = fileprefix + file + filesuffix
             save_filename = os.path.join(output_dir, savefilenameprefix + file + filesuffix)
-
-            image = images[i]
-            im = 255. * image.squeeze(0).cpu().numpy()
-            img = Image.fromarray(np.clip(im, 0, 255).astype(np.uint8))
-            # Export image
-            if image_export_format == ".png lossless":
-                metadata = PngInfo()
-                img.save(save_filename, pnginfo=metadata, compress_level=4)
-                datatype = "data:image/png"
-                extension = "png"
-            else: # .webp
-                imgexif = img.getexif()
-                datatype = "data:image/webp"
-                extension = "webp"
-                if image_export_format == ".webp lossy 80":
-                    img.save(save_filename, method=6, exif=imgexif, lossless=False, quality=80)
-                elif image_export_format == ".webp lossy 90":
-                    img.save(save_filename, method=6, exif=imgexif, lossless=False, quality=90)
-                else: # ".webp lossless"
-                    img.save(save_filename, method=6, exif=imgexif, lossless=True, quality=0)
             this_fileid.append(file)
             this_filenames.append(this_filename)
             save_filenames.append(save_filename)
+            this_thumbnails.append(os.path.join(os.path.dirname(fileprefix), "thumbs", "img-" + file + ".webp"))
+            save_thumbnails.append(os.path.join(files_dir, "thumbs", "img-" + file + ".webp"))
+
+        # When appending, images already in the manifest and on disk are not encoded again
+        pending = [
+            i for i in range(len(this_fileid))
+            if this_fileid[i] not in manifest["images"] or not os.path.exists(save_filenames[i])
+            or (lazy_load_thumbnails and not os.path.exists(save_thumbnails[i]))
+        ]
+        for i in pending:
+            manifest["images"][this_fileid[i]] = {
+                "filename": this_filenames[i],
+                "prompt": prompts[i],
+                "ids": list(combination_ids[i]),
+            }
+            if lazy_load_thumbnails:
+                manifest["images"][this_fileid[i]]["thumbnail"] = this_thumbnails[i]
+
+        # Prepare list of ids for html
+        ids = [[] for _ in range(8)]
+        for entry in manifest["images"].values():
+            for i, id_part in enumerate(entry["ids"]):
+                if id_part not in ids[i]:
+                    ids[i].append(id_part)
+
+        # After processing all combinations, check each slot
+        for i in range(len(ids)):
+            if len(ids[i])==1 and ids[i][0] == '':
+                ids[i] = []
 
-        images_text = "["
-        for i in range(len(save_filenames)):
+        ids_text = []
+        for id_list in ids:
+            if id_list:
+                ids_text.append(f'{id_list}')
+            else:
+                ids_text.append('null')
+
+        def export_image(k, pixels):
+            i = pending[k]
+            img = Image.fromarray(pixels)
+            if not embed_all_images_in_html:
+                self.encode_image(img, save_filenames[i], image_export_format, encoding_preset)
+                if lazy_load_thumbnails:
+                    img.thumbnail((thumbnail_size, thumbnail_size))
+                    img.save(save_thumbnails[i], format="WEBP", method=self.webp_methods[encoding_preset], quality=80)
+                return None
+            buffer = io.BytesIO()
+            self.encode_image(img, buffer, image_export_format, encoding_preset)
+            # The temp copy only backs the node's preview; the gallery is built from the buffer
+            with open(save_filenames[i], "wb") as f:
+                f.write(buffer.getbuffer())
+            base64_string = base64.b64encode(buffer.getbuffer()).decode('ascii')
+            return "{ id: \""+ this_fileid[i] +"\", base64data: \""+ datatype +";base64,"+ base64_string +"\", prompt: \""+prompts[i].replace('"', "'")+"\"},"
+
+        for i in pending:
             save_filename = save_filenames[i]
-            this_filename = this_filenames[i]
-            fileid = this_fileid[i]
-            prompt = prompts[i]
             results.append({
                 "filename": os.path.basename(os.path.normpath(save_filename)),
                 "subfolder": os.path.dirname(os.path.normpath(save_filename)),
                 "type": self.type
-            });
-            if not embed_all_images_in_html:
-                images_text += "{ id: \""+ fileid +"\", filename: \""+ this_filename +"\", prompt: \""+prompt.replace('"', "'")+"\"},"
-            else:
-                base64_string = ''
-                with open(save_filename, "rb") as f:
-                    file_content = f.read()
-                    base64_string = base64.b64encode(file_content).decode('utf-8')
-                images_text += "{ id: \""+ fileid +"\", base64data: \""+ datatype +";base64,"+ base64_string +"\", prompt: \""+prompt.replace('"', "'")+"\"},"
-        images_text += "]"
+            })
 
         data = {
             "{!ids1}": ids_text[0],
@@ -351,33 +859,58 @@ class PromptCombinatorExportGallery:
             "{!ids8}": ids_text[7],
             "{!fileprefix}": '"'+fileprefix.replace('"', '\\"')+'"',
             "{!filesuffix}": '"'+filesuffix.replace('"', '\\"')+'"',
-            "{!images}": images_text,
-            "{!width}": str(images[0].shape[2]),
-            "{!height}": str(images[0].shape[1]),
+            "{!width}": str(manifest["width"]),
+            "{!height}": str(manifest["height"]),
             "{!format}": '"'+extension+'"',
         }
 
-        # Read HTML template, fill in, and write HTML to file
+        # Fill in the HTML template. Pillow releases the GIL while encoding, so images are encoded
+        # on all cores. Embedded image records are streamed to the file in input order as they are
+        # encoded; linked galleries are written from the manifest once the new files exist.
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        if not embed_all_images_in_html:
+        if lazy_load_thumbnails:
+            template_file = os.path.join(script_dir, 'html_lazy.template')
+        elif not embed_all_images_in_html:
             template_file = os.path.join(script_dir, 'html.template')
         else:
             template_file = os.path.join(script_dir, 'html_embedded.template')
-        with open(template_file, 'r') as file:
-            html_template = file.read()
-
-        rep = dict((re.escape(k), v) for k, v in data.items()) 
-        pattern = re.compile("|".join(rep.keys()))
-        filled_html = pattern.sub(lambda m: rep[re.escape(m.group(0))], html_template)
 
-        with open(output_file, 'w') as file:
-            file.write(filled_html)
+        workers = os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            batches = self.to_uint8_batches([images[i] for i in pending], workers * 2)
+            encoded = self.ordered_map(executor, export_image, batches, workers * 2)
+            if not embed_all_images_in_html:
+                for _ in encoded:
+                    pass
+                records = (
+                    "{ id: \""+ fileid +"\", filename: \""+ entry["filename"] +"\", prompt: \""+entry["prompt"].replace('"', "'")+"\"},"
+                    for fileid, entry in manifest["images"].items()
+                )
+                self.save_manifest(manifest_file, manifest)
+                if lazy_load_thumbnails:
+                    pages = self.write_pages(files_dir, manifest, page_size)
+                    data["{!pages}"] = json.dumps(pages)
+                    data["{!pageprefix}"] = json.dumps(os.path.join(os.path.dirname(fileprefix), "page-"))
+            else:
+                records = encoded
+
+            with open(output_file, 'w') as file:
+                for part in self.load_template(template_file):
+                    if part == "{!images}":
+                        file.write("[")
+                        for record in records:
+                            file.write(record)
+                        file.write("]")
+                    else:
+                        file.write(data.get(part, part))
     
-        print("Exported gallery to ",output_file)
+        if append_to_existing:
+            print(f"Added {len(pending)} images to gallery ",output_file)
+        else:
+            print("Exported gallery to ",output_file)
 
         return { "ui": { "images": results } }
 
-
 class PromptCombinatorRandomPrompt:
     """
     ComfyUI-Prompt-Combinator
@@ -407,7 +940,7 @@ class PromptCombinatorRandomPrompt:
     def pick_random(self, prompts, combination_ids, seed):
         assert len(combination_ids) == len(prompts), "Amount of combination ids must be the same as amount of prompts"
     
-        index = random.randint(0, len(prompts) - 1)
+        index = random.Random(seed[0]).randint(0, len(prompts) - 1)
         prompt = prompts[index]
         combination_id = combination_ids[index]
 